@@ -1,11 +1,41 @@
 """evaluation_framework.py -- All that is needed to evaluate feature selection algorithms."""
 
+from __future__ import division, print_function
+
+# Importing local libraries first,
+# because otherwise Error in `python': free(): invalid pointer
+try:
+    import multitask_sfan
+except ImportError:
+    # gt_maxflow has not been built: sfan will be run externally.
+    multitask_sfan = None
+else:
+    # Networks parsed by the solvers run within this process
+    sfan_network_cache = multitask_sfan.NetworkCache()
+import generate_data
+
+import contextlib
+import ctypes
+import logging
 import numpy as np
+import os
+import resource
+import sys
 import tables as tb
+import tempfile
 import subprocess
 import shlex
 import math
+import multiprocessing
 
+try:
+    from time import process_time
+except ImportError:
+    # Python 2
+    from time import clock as process_time
+
+from joblib import Parallel, delayed
+from scipy import sparse
 from sklearn import linear_model, metrics, model_selection 
 
 def consistency_index(sel1, sel2, num_features):
@@ -63,16 +93,30 @@ def consistency_index_k(sel_list, num_features):
     Kuncheva, L.I. (2007). A Stability Index for Feature Selection.
     AIAC, pp. 390--395.
     """
-    cidx = 0.
-    for k1, sel1 in enumerate(sel_list[:-1]):
-        # sel_list[:-1] to not take into account the last list.
-        # avoid a problem with sel_list[k1+1:] when k1 is the last element,
-        # that give an empty list overwise
-        # the work is done at the second to last element anyway
-        for sel2 in sel_list[k1+1:]:
-            cidx += consistency_index(set(sel1), set(sel2), num_features)
-    cidx = 2.  * cidx / (len(sel_list) * (len(sel_list) - 1))
-    return cidx
+    # Boolean membership matrix: one row per set, one column per feature
+    # selected at least once (the others do not contribute to intersections).
+    # All pairwise intersection sizes are then given by a single product.
+    num_sets = len(sel_list)
+    sel_arrays = [np.asarray(sel, dtype=int) for sel in sel_list]
+    set_indices = np.repeat(np.arange(num_sets), [sel.shape[0] for sel in sel_arrays])
+    all_selected = np.concatenate([np.zeros(0, dtype=int)] + sel_arrays)
+    selected_features, columns = np.unique(all_selected, return_inverse=True)
+    membership = np.zeros((num_sets, selected_features.shape[0]), dtype=np.float32)
+    membership[set_indices, columns] = 1.
+    sizes = membership.sum(axis=1, dtype=np.float64)
+    observed = membership.dot(membership.T).astype(np.float64)
+    expected = np.outer(sizes, sizes) / float(num_features)
+    maxposbl = np.minimum.outer(sizes, sizes)
+
+    # Same convention as consistency_index: -1 for pairs where
+    # expected == maxposbl (trivial selections).
+    cidx = -np.ones((num_sets, num_sets))
+    valid = (expected != maxposbl)
+    cidx[valid] = (observed[valid] - expected[valid]) / \
+                  (maxposbl[valid] - expected[valid])
+
+    # Average over all pairs (strict upper triangle)
+    return cidx[np.triu_indices(num_sets, 1)].mean()
 
 
 def consistency_index_task(selection_fname, num_folds, num_tasks, num_features):
@@ -82,6 +126,7 @@ def consistency_index_task(selection_fname, num_folds, num_tasks, num_features):
     ---------
     selection_fname : filename
         Template of path where were write list of selected features
+        (their binary copies, <selection_fname>.npy, are read if they are up to date)
     num_folds: int
         Total number of fold
     num_tasks: int
@@ -101,100 +146,130 @@ def consistency_index_task(selection_fname, num_folds, num_tasks, num_features):
     # so for each line in these files, we compute the ci between the features selected for each fold
 
 
-    # As there are ~10 folds, there are 10 files.
-    # they don't take a lot of memory
-    # so it is ok to open them all :
-    fold_f_list = []
-    for fold_idx in xrange (num_folds) :
-        f_sel = open(selection_fname %fold_idx, 'r')
-        fold_f_list.append(f_sel)
+    # Selected features of each fold and each task, padded with -1:
+    # at most num_features features are selected for a task.
+    selected = np.full((num_folds, num_tasks, num_features), -1, dtype=np.int32)
+    for fold_idx in range (num_folds) :
+        npy_fname = get_selected_features_npy_fname(selection_fname %fold_idx)
+        if is_cache_valid(npy_fname, [selection_fname %fold_idx]):
+            # up-to-date binary copy, already padded with -1
+            fold_selected = np.load(npy_fname)[:num_tasks]
+            selected[fold_idx, :fold_selected.shape[0], :fold_selected.shape[1]] = fold_selected
+            continue
+        with open(selection_fname %fold_idx, 'rb') as f_sel:
+            for task_idx in range (num_tasks):
+                # increment a line in the file
+                line = f_sel.readline().strip()
+                if line:
+                    content = np.fromstring(line, dtype=np.int32, sep=' ')
+                    selected[fold_idx, task_idx, :content.shape[0]] = content
 
-    
     ci_list = []
     # For each task : 
-    for task_idx in xrange (num_tasks):
-        sel_list = []
-        for f_sel in fold_f_list :
-            # increment aline in each file
-            content = f_sel.readline().split()
-            # append lines content in sel_list
-            sel_list.append(content)
+    for task_idx in range (num_tasks):
+        sel_list = [sel[sel >= 0] for sel in selected[:, task_idx]]
         # compute the ci between the features selected for each fold at this current task
         ci =  consistency_index_k(sel_list, num_features)
         ci_list.append(ci)
 
-    for f in fold_f_list :
-        f.close()
-
     return ci_list
 
 
-def run_sfan(num_tasks, network_fname, weights_fnames, params):
-    """ Run single task sfan (on each task).
+def parse_sfan_output(p_out, num_tasks):
+    """ Parse the standard output of multitask_sfan.py.
 
     Arguments
     ---------
+    p_out: list of strings
+        Lines of the standard output of multitask_sfan.py.
     num_tasks: int
-        Number of tasks. 
-    network_fname: filename
-        Path to the network file.
-    weights_fnames: list of filenames
-        List of paths to the network nodes files (one per task).
+        Number of tasks.
+
+    Returns
+    -------
+    sel_list: list of arrays
+        For each task, an (int32) array of selected features, as indices,
+        STARTING AT 0.
+        Empty if the output does not hold one line per task.
+    timing: string
+        Timing info printed after the selected features.
+    """
+    # Skip the header ('# lambda ...', '# eta ...' and, if mu != 0, '# mu ...')
+    first_line = 0
+    while first_line < len(p_out) and p_out[first_line].startswith('#'):
+        first_line += 1
+
+    sel_lines = p_out[first_line:first_line+num_tasks]
+    if len(sel_lines) < num_tasks:
+        sel_list = []
+    else:
+        # Stripped, as np.fromstring parses a line holding only whitespace as [0]
+        sel_list = [np.fromstring(line.strip(), dtype=np.int32, sep=' ') - 1 \
+                    for line in sel_lines]
+
+    timing = '\n'.join(p_out[first_line+num_tasks:])
+
+    return sel_list, timing
+
+
+def run_sfan_command(argum, num_tasks, algo, params):
+    """ Run multitask_sfan.py (wrapped in /usr/bin/time) and process its outputs.
+
+    Arguments
+    ---------
+    argum: list of strings
+        Command line to run.
+    num_tasks: int
+        Number of tasks.
+    algo: string
+        Name of the algorithm (for logging purposes).
     params: string
         Hyperparameters, in the '-l <lambda> -e <eta> -m <mu>' format.
 
     Returns
     -------
-    sel_list: list of lists
-        For each task, a list of selected features, as indices,
+    sel_list: list of arrays
+        For each task, an (int32) array of selected features, as indices,
         STARTING AT 0.
+    timing: string
+        Timing info.
+    maxRSS: string
+        Maximum resident set size of the process (in KB).
     """
-    # Ideally, I'd do the following:
-    # sfan_solver = Sfan(num_tasks, network_fname, weights_fname,
-    #                    lbd, eta, 0, covariance_fname)
-    # tt = sfan_solver.create_dimacs()
-    # sfan_solver.run_maxflow()
-
-    # But because cython output to screen is NOT caught by sys.stdout, 
-    # we need to run this externally
-    argum = ['/usr/bin/time', '--format=%M', 
-             'python', 'multitask_sfan.py',
-             '--num_tasks', str(num_tasks),
-             '--networks', network_fname,
-             '--node_weights']
-    argum.extend(weights_fnames)
-    argum.extend(params.split())
-    argum.extend(['-m', '0'])
-    print '+++'
-    print argum
-    p = subprocess.Popen(argum, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    logging.debug("+++ %s", argum)
+    p = subprocess.Popen(argum, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         universal_newlines=True)
     # stdout=subprocess.PIPE -> something should read the output while the process is still running
     # stderr=subprocess.STDOUT : To also capture standard error in the result
 
     p_com = p.communicate()
     p_out = p_com[0].split("\n")
     p_err = p_com[1].split("\n")
-    print p_com
-    # Process the output to get lists of selected features
-    sel_list = [[(int(x)-1) for x in line.split()] for line in p_out[2:2+num_tasks]]
+    logging.debug("%s", p_com)
+
+    # Process the standart output to get lists of selected features
+    # and timing info
+    sel_list, timing = parse_sfan_output(p_out, num_tasks)
 
     if not sel_list :
         #TODO : fix no sel_list issue#1
         #import pdb ; pdb.set_trace()
-        print "WARNING : returned sel_list empty !! algo = st ; param = ", params
-        sel_list = [[] for i in xrange(num_tasks)]
-
-    # Process the standart output to get timing info 
-    timing = '\n'.join(p_out[2+num_tasks:])
+        logging.warning("returned sel_list empty !! algo = %s ; param = %s", algo, params)
+        sel_list = [np.zeros(0, dtype=np.int32) for i in range(num_tasks)]
 
     # Process the standart error to get maxRSS info : 
     maxRSS = p_err[-2]
 
     return sel_list, timing, maxRSS
-                 
 
-def run_msfan_nocorr(num_tasks, network_fname, weights_fnames, params):
-    """ Run multitask sfan (no precision/covariance matrix).
+
+# Command-line prefixes of multitask_sfan.py, by (num_tasks, network_fname,
+# weights_fnames, covariance_fname)
+sfan_argv_cache = {}
+
+def get_sfan_argv(num_tasks, network_fname, weights_fnames, covariance_fname=None):
+    """ Build the part of the multitask_sfan.py command line
+    that does not depend on the hyperparameters.
 
     Arguments
     ---------
@@ -204,47 +279,220 @@ def run_msfan_nocorr(num_tasks, network_fname, weights_fnames, params):
         Path to the network file.
     weights_fnames: list of filenames
         List of paths to the network nodes files (one per task).
+    covariance_fname: {filename, None}, optional
+        Path to the matrix of covariance (similarity) of tasks.
+
+    Returns
+    -------
+    argum: tuple of strings
+        Command line, to be completed with the hyperparameters.
+    """
+    key = (num_tasks, network_fname, tuple(weights_fnames), covariance_fname)
+    if key not in sfan_argv_cache:
+        argum = ['/usr/bin/time', '-f', '%M',
+                 'python', 'multitask_sfan.py',
+                 '--num_tasks', str(num_tasks),
+                 '--networks', network_fname,
+                 '--node_weights']
+        argum.extend(weights_fnames)
+        if covariance_fname is not None:
+            argum.extend(['--covariance_matrix', covariance_fname])
+        sfan_argv_cache[key] = tuple(argum)
+    return sfan_argv_cache[key]
+
+
+# Hyperparameters values, by '-l <lambda> -e <eta> -m <mu>' string
+hyperparams_cache = {}
+
+def parse_hyperparams(params):
+    """ Parse a hyperparameters string.
+
+    Arguments
+    ---------
     params: string
         Hyperparameters, in the '-l <lambda> -e <eta> -m <mu>' format.
+        If a parameter is given several times, the last value is used.
 
     Returns
     -------
-    sel_list: list of lists
-        For each task, a list of selected features, as indices,
-        STARTING AT 0.
+    hyperparams: dict
+        Value of each hyperparameter, indexed by its flag ('-l', '-e', '-m').
+        Must not be modified.
     """
-    argum = ['/usr/bin/time', '-f', '%M',
-             'python', 'multitask_sfan.py',
-             '--num_tasks', str(num_tasks),
-             '--networks', network_fname,
-             '--node_weights']
-    argum.extend(weights_fnames)
-    argum.extend(params.split())
-    print '+++'
-    print argum
-    p = subprocess.Popen(argum, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if params not in hyperparams_cache:
+        flags_values = params.split()
+        hyperparams_cache[params] = dict(zip(flags_values[::2],
+                                             [float(x) for x in flags_values[1::2]]))
+    return hyperparams_cache[params]
 
-    p_com = p.communicate()
-    p_out = p_com[0].split("\n")
-    p_err = p_com[1].split("\n")
-    print p_com
-    # Process the output to get lists of selected features
-    
-    sel_list = [[(int(x)-1) for x in line.split()] for line in p_out[3:3+num_tasks]]
 
+@contextlib.contextmanager
+def capture_stdout(output):
+    """ Capture everything written to the standard output file descriptor,
+    including by C/C++ code (which sys.stdout does not see).
+
+    Parameters
+    ----------
+    output: list
+        List to which the captured output is appended (as a string)
+        when leaving the context.
+    """
+    sys.stdout.flush()
+    saved_stdout_fd = os.dup(1)
+    # A temporary file rather than a pipe, so that large outputs
+    # cannot block the writer.
+    tmp_f = tempfile.TemporaryFile(mode='w+')
+    os.dup2(tmp_f.fileno(), 1)
+    try:
+        yield
+    finally:
+        # Flush C stdio buffers (std::cout writes through them)
+        ctypes.CDLL(None).fflush(None)
+        sys.stdout.flush()
+        os.dup2(saved_stdout_fd, 1)
+        os.close(saved_stdout_fd)
+        tmp_f.seek(0)
+        output.append(tmp_f.read())
+        tmp_f.close()
+
+
+def run_sfan_in_process(num_tasks, network_fname, weights_fnames, params,
+                        covariance_fname=None):
+    """ Run sfan within the current process, without starting a new interpreter.
+
+    Arguments
+    ---------
+    num_tasks: int
+        Number of tasks. 
+    network_fname: filename
+        Path to the network file.
+    weights_fnames: list of filenames
+        List of paths to the network nodes files (one per task).
+    params: string
+        Hyperparameters, in the '-l <lambda> -e <eta> -m <mu>' format.
+        If a parameter is given several times, the last value is used.
+    covariance_fname: {filename, None}, optional
+        Path to the matrix of covariance (similarity) of tasks.
+
+    Returns
+    -------
+    sel_list: list of arrays
+        For each task, an (int32) array of selected features, as indices,
+        STARTING AT 0.
+    timing: string
+        Timing info, in the format of multitask_sfan.py.
+        The process time is that of this run only.
+        If the problem cannot be solved (multitask_sfan.SfanError),
+        nothing is selected and only the process time is given.
+    maxRSS: string
+        Memory used by the solver (in KB): increase of the maximum resident set
+        size of the current process during this run. Only meaningful if the
+        process runs a single solver (see run_sfan_many).
+    """
+    hyperparams = parse_hyperparams(params)
+
+    maxRSS_start = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    time_start = process_time()
+
+    try:
+        sfan_solver = multitask_sfan.Sfan(num_tasks, [network_fname], weights_fnames,
+                                          hyperparams['-l'], hyperparams['-e'],
+                                          mu=hyperparams.get('-m'),
+                                          covariance_matrix_f=covariance_fname,
+                                          network_cache=sfan_network_cache)
+    except multitask_sfan.SfanError as e:
+        # As when multitask_sfan.py exits with an error: nothing is selected
+        #TODO : fix no sel_list issue#1
+        logging.warning("returned sel_list empty !! param = %s (%s)", params, e)
+        sel_list = [np.zeros(0, dtype=np.int32) for i in range(num_tasks)]
+        timing = "Process time: {0}\n".format(process_time() - time_start)
+        maxRSS = str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - maxRSS_start)
+        return sel_list, timing, maxRSS
+    time_post_setout_process = process_time()
+
+    time_task_computations = sfan_solver.create_dimacs()
+    time_all_tasks_computations = process_time()
+
+    output = []
+    with capture_stdout(output):
+        sfan_solver.run_maxflow()
+    time_gt_maxflow = process_time()
+
+    timing = multitask_sfan.format_runtimes(time_post_setout_process,
+                                            time_task_computations,
+                                            time_all_tasks_computations,
+                                            time_gt_maxflow,
+                                            time_gt_maxflow - time_start)
+
+    sel_list, _ = parse_sfan_output(output[0].split("\n"), num_tasks)
     if not sel_list :
         #TODO : fix no sel_list issue#1
-        #import pdb ; pdb.set_trace()
-        print "WARNING : returned sel_list empty !! algo = np ; param = ", params
-        sel_list = [[] for i in xrange(num_tasks)]
-
-    # Process the output to get timing info 
-    timing = '\n'.join(p_out[3+num_tasks:])
+        logging.warning("returned sel_list empty !! param = %s", params)
+        sel_list = [np.zeros(0, dtype=np.int32) for i in range(num_tasks)]
 
-    # Process the outut to get maxRSS info : 
-    maxRSS = p_err[-2]
+    maxRSS = str(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - maxRSS_start)
 
     return sel_list, timing, maxRSS
+
+
+def run_sfan(num_tasks, network_fname, weights_fnames, params):
+    """ Run single task sfan (on each task).
+
+    Arguments
+    ---------
+    num_tasks: int
+        Number of tasks. 
+    network_fname: filename
+        Path to the network file.
+    weights_fnames: list of filenames
+        List of paths to the network nodes files (one per task).
+    params: string
+        Hyperparameters, in the '-l <lambda> -e <eta> -m <mu>' format.
+
+    Returns
+    -------
+    sel_list: list of arrays
+        For each task, an (int32) array of selected features, as indices,
+        STARTING AT 0.
+    """
+    if multitask_sfan is not None:
+        return run_sfan_in_process(num_tasks, network_fname, weights_fnames,
+                                   params + ' -m 0')
+
+    # gt_maxflow could not be imported: run this externally
+    argum = list(get_sfan_argv(num_tasks, network_fname, weights_fnames)) + \
+            params.split() + ['-m', '0']
+    return run_sfan_command(argum, num_tasks, 'st', params)
+                 
+
+def run_msfan_nocorr(num_tasks, network_fname, weights_fnames, params):
+    """ Run multitask sfan (no precision/covariance matrix).
+
+    Arguments
+    ---------
+    num_tasks: int
+        Number of tasks. 
+    network_fname: filename
+        Path to the network file.
+    weights_fnames: list of filenames
+        List of paths to the network nodes files (one per task).
+    params: string
+        Hyperparameters, in the '-l <lambda> -e <eta> -m <mu>' format.
+
+    Returns
+    -------
+    sel_list: list of arrays
+        For each task, an (int32) array of selected features, as indices,
+        STARTING AT 0.
+    """
+    if multitask_sfan is not None:
+        return run_sfan_in_process(num_tasks, network_fname, weights_fnames,
+                                   params)
+
+    # gt_maxflow could not be imported: run this externally
+    argum = list(get_sfan_argv(num_tasks, network_fname, weights_fnames)) + \
+            params.split()
+    return run_sfan_command(argum, num_tasks, 'np', params)
                  
 
 def run_msfan(num_tasks, network_fname, weights_fnames, covariance_fname, params):
@@ -265,47 +513,204 @@ def run_msfan(num_tasks, network_fname, weights_fnames, covariance_fname, params
 
     Returns
     -------
-    sel_list: list of lists
-        For each task, a list of selected features, as indices,
+    sel_list: list of arrays
+        For each task, an (int32) array of selected features, as indices,
         STARTING AT 0.
     """
-    argum = ['/usr/bin/time', '-f', '%M',
-             'python', 'multitask_sfan.py',
-             '--num_tasks', str(num_tasks),
-             '--networks', network_fname,
-             '--node_weights']
-    argum.extend(weights_fnames)
-    argum.extend(['--covariance_matrix', covariance_fname])
-    argum.extend(params.split())
-    print '+++'
-    print argum
-    p = subprocess.Popen(argum, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if multitask_sfan is not None:
+        return run_sfan_in_process(num_tasks, network_fname, weights_fnames,
+                                   params, covariance_fname=covariance_fname)
 
-    p_com = p.communicate()
-    p_out = p_com[0].split("\n")
-    p_err = p_com[1].split("\n")
-    print p_com
-    # Process the output to get lists of selected features
-    sel_list = [[(int(x)-1) for x in line.split()] for line in p_out[3:3+num_tasks]]
+    # gt_maxflow could not be imported: run this externally
+    argum = list(get_sfan_argv(num_tasks, network_fname, weights_fnames,
+                               covariance_fname)) + params.split()
+    return run_sfan_command(argum, num_tasks, 'msfan', params)
 
-    if not sel_list : 
-        #TODO : fix no sel_list issue#1
-        #import pdb ; pdb.set_trace() 
-        print "WARNING : returned sel_list empty !! algo = msfan ; param = ", params
-        sel_list = [[] for i in xrange(num_tasks)]
 
-    # Process the output to get timing info 
-    timing = '\n'.join(p_out[3+num_tasks:])
+# Maximum number of worker processes started at the same time by run_sfan_many
+# and get_optimal_parameters_from_dict (None: the number of CPUs).
+# Lowered when several repeats are run in parallel, each in its own process.
+max_num_workers = None
 
-    # Process the outut to get maxRSS info : 
-    maxRSS = p_err[-2]
 
-    return sel_list, timing, maxRSS
-                 
+# Process id of the worker running each job of run_sfan_many (0: not started yet),
+# set in each worker process by init_sfan_worker
+sfan_job_pids = None
+
+
+def init_sfan_worker(job_pids):
+    """ Initialize a worker process of run_sfan_many.
+
+    Arguments
+    ---------
+    job_pids: multiprocessing.RawArray
+        Process id of the worker running each job.
+    """
+    global sfan_job_pids
+    sfan_job_pids = job_pids
+
+
+def run_sfan_job(indexed_job):
+    """ Run one job of run_sfan_many.
+
+    Arguments
+    ---------
+    indexed_job: (int, (function, tuple)) pair
+        Index of the job, and the job itself: one of run_sfan, run_msfan_nocorr
+        or run_msfan, with the tuple of arguments to call it with.
+
+    Returns
+    -------
+    The (sel_list, timing, maxRSS) tuple returned by the function.
+
+    Side effects
+    ------------
+    Record the id of the current process in sfan_job_pids.
+    Raise a RuntimeError if the function calls sys.exit: a worker process
+    exiting this way would never return its result to the pool.
+    """
+    job_idx, (run_function, arguments) = indexed_job
+    if sfan_job_pids is not None:
+        sfan_job_pids[job_idx] = os.getpid()
+    try:
+        return run_function(*arguments)
+    except SystemExit as e:
+        raise RuntimeError("%s exited (status %s) with arguments %s" % \
+                           (run_function.__name__, e.code, repr(arguments)))
+
+
+def get_sfan_job_result(async_result, job_pids, job_idx, timeout=1):
+    """ Wait for the result of a job of run_sfan_many.
+
+    Arguments
+    ---------
+    async_result: multiprocessing.pool.AsyncResult
+        Pending result of the job.
+    job_pids: multiprocessing.RawArray
+        Process id of the worker running each job.
+    job_idx: int
+        Index of the job.
+    timeout: float, optional
+        Time (in seconds) after which the worker running the job is checked.
+
+    Returns
+    -------
+    The (sel_list, timing, maxRSS) tuple returned by the job.
+
+    Side effects
+    ------------
+    Raise a RuntimeError if the worker process running the job died
+    without returning its result (e.g. the solver aborted):
+    the pool would otherwise wait for it forever.
+    """
+    while not async_result.ready():
+        async_result.wait(timeout)
+        if async_result.ready() or not job_pids[job_idx]:
+            continue
+        if job_pids[job_idx] not in [process.pid for process \
+                                     in multiprocessing.active_children()]:
+            # The worker exited: give its result, if any, time to arrive
+            async_result.wait(timeout)
+            if not async_result.ready():
+                raise RuntimeError("Worker process %d died while running job %d" % \
+                                   (job_pids[job_idx], job_idx))
+    return async_result.get()
+
+
+def run_sfan_many(jobs, num_workers=None):
+    """ Run several sfan solvers concurrently.
+
+    The jobs are dispatched to a pool of worker processes
+    (the solver holds the interpreter lock, and its output is captured
+    at the level of the process' file descriptors).
+    Each job runs in a new worker process, so that its maxRSS only
+    measures the memory used by its solver; the networks are parsed
+    beforehand, and inherited by the worker processes.
+
+    Arguments
+    ---------
+    jobs: list of (function, tuple) pairs
+        Each job is one of run_sfan, run_msfan_nocorr or run_msfan,
+        with the tuple of arguments to call it with.
+        e.g. (run_sfan, (num_tasks, network_fname, weights_fnames, params))
+    num_workers: {int, None}, optional
+        Maximum number of solvers running at the same time.
+        Defaults to max_num_workers, or to the number of CPUs.
+
+    Returns
+    -------
+    results: list
+        For each job, in the order of jobs, the (sel_list, timing, maxRSS)
+        tuple returned by its function.
+
+    Side effects
+    ------------
+    Raise a RuntimeError, and stop the other jobs, if a job fails
+    or if its worker process dies.
+    """
+    if not jobs:
+        return []
+    if num_workers is None:
+        num_workers = max_num_workers or multiprocessing.cpu_count()
+
+    if multitask_sfan is not None:
+        # Parse the networks once, in this process
+        # (solver arguments: num_tasks, network_fname, ...)
+        for run_function, arguments in jobs:
+            if run_function in (run_sfan, run_msfan_nocorr, run_msfan):
+                sfan_network_cache.get(arguments[1])
+
+    job_pids = multiprocessing.RawArray('i', len(jobs))
+    pool = multiprocessing.Pool(min(num_workers, len(jobs)), init_sfan_worker,
+                                (job_pids, ), maxtasksperchild=1)
+    try:
+        async_results = [pool.apply_async(run_sfan_job, ((job_idx, job), )) \
+                         for job_idx, job in enumerate(jobs)]
+        results = [get_sfan_job_result(async_result, job_pids, job_idx) \
+                   for job_idx, async_result in enumerate(async_results)]
+        pool.close()
+    except BaseException:
+        # A lost job would keep the pool waiting for it
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return results
+
+
+def mean_consistency_index(params, selected_dict_p, num_features):
+    """ Compute the mean, over tasks, of the consistency index between
+    the features selected on each subsample with a given set of parameters.
+
+    Arguments
+    ---------
+    params: string
+        Hyperparameters, in the '-l <lambda> -e <eta> -m <mu>' format.
+    selected_dict_p: dictionary
+        keys = task index
+        values = list of list of selected features (for each subsample)
+    num_features: int
+        Total number of features
+
+    Returns
+    -------
+    params: string
+        The hyperparameters, unchanged (so that results of parallel
+        calls can be matched to their parameters).
+    ci_mean: float
+        Mean over tasks of the consistency indices.
+    """
+    ci_list = [consistency_index_k(sel_list, num_features) \
+               for sel_list in selected_dict_p.values()]
+    return params, np.mean(ci_list)
+
 
 def get_optimal_parameters_from_dict(selected_dict, num_features): 
     """ Find optimal parameters from dictionary of selected features
 
+    The consistency indices of the candidate parameters are computed
+    in parallel, using all available cores (or max_num_workers of them).
+
     Arguments
     ---------
     selected_dict: dictionary
@@ -323,21 +728,22 @@ def get_optimal_parameters_from_dict(selected_dict, num_features):
         of features selected for each subsample for each task
         => params leading to the best ci mean.
     """
+    n_jobs = max_num_workers or -1
+    ci_means = Parallel(n_jobs=n_jobs)(delayed(mean_consistency_index)(params,
+                                                                  selected_dict_p,
+                                                                  num_features) \
+                                   for (params, selected_dict_p) in selected_dict.items())
+
     opt_params = ''
     opt_ci_mean = -1 # set to -1 because it is the worst case ci value 
-    for (params, selected_dict_p) in selected_dict.iteritems():
-        ci_list = [] #list of ci, one per task, computed with current params
-        for (task_idx, sel_list) in selected_dict_p.iteritems():
-            ci_of_current_task = consistency_index_k(sel_list, num_features)
-            ci_list.append(ci_of_current_task) 
-        ci_mean = np.mean(ci_list)
+    for (params, ci_mean) in ci_means:
         if ci_mean >= opt_ci_mean:
             opt_ci_mean = ci_mean
             opt_params = params
     return opt_params
 
 
-def run_ridge_selected(selected_features, genotype_fname, phenotype_fname,
+def run_ridge_selected(selected_features, genotype_fname, phenotype,
                        tr_indices, te_indices, output_fname):
     """ Run a ridge-regression using only the selected features.
 
@@ -347,8 +753,8 @@ def run_ridge_selected(selected_features, genotype_fname, phenotype_fname,
         List of indices of selected features.
     genotype_fname: filename
         Path to genotype data.
-    phenotype_fname: filename
-        Path to phenotype data.
+    phenotype: array
+        Phenotype of each sample.
     tr_indices: list
         List of training indices.
     te_indices: list
@@ -375,7 +781,7 @@ def run_ridge_selected(selected_features, genotype_fname, phenotype_fname,
     #----------------------------------------
     # Read data : 
 
-    if not selected_features :
+    if len(selected_features) == 0 :
         # Safeguard for when SFAN returns empty list
         # Avoid not allowed empty selections 
         #TODO : fix no sel_list issue#1
@@ -384,23 +790,14 @@ def run_ridge_selected(selected_features, genotype_fname, phenotype_fname,
         preds = np.array([np.nan ] * len(te_indices) )
     else :
         # read genotypes : 
-        with tb.open_file(genotype_fname, 'r') as h5f:
-            table = h5f.root.Xtr
-            # table.shape : 
-            # For each feature (in line), 
-            # there is the genotype of each sample (in column)
-            X = table[selected_features, :]
+        # For each feature (in line), 
+        # there is the genotype of each sample (in column)
+        X = generate_data.read_genotypes(genotype_fname, selected_features)
 
         Xtr = [X[:,tr] for tr in tr_indices]
         Xte = [X[:,te] for te in te_indices]
 
-        # read phenotypes : 
-        with open(phenotype_fname, 'r') as f:
-            # continuous phenotype for each sample (in line)
-            y = f.read().split()
-            y = [float(item) for item in y]
-
-        ytr = [ y[tr] for tr in tr_indices]
+        ytr = [phenotype[tr] for tr in tr_indices]
         #----------------------------------------
 
         # Instantiate a ridge regression
@@ -420,14 +817,13 @@ def run_ridge_selected(selected_features, genotype_fname, phenotype_fname,
 
 
 
-def compute_ridge_selected_RMSE(phenotype_fnames, y_pred_template, xp_indices):
+def compute_ridge_selected_RMSE(phenotypes, y_pred_template, xp_indices):
     """ Compute RMSE (Root Mean Squared Error)
 
     Arguments
     ---------
-    phenotype_fnames: aray of filename
-        Path to phenotype datas.
-        (one path per task)
+    phenotypes: (num_tasks, num_samples) array
+        Phenotypes of each task.
     y_pred_template: string
         Template of path where were write list of predictions on the test set
     xp_indices: list of dictionaries
@@ -445,15 +841,11 @@ def compute_ridge_selected_RMSE(phenotype_fnames, y_pred_template, xp_indices):
         List of rmse task per task.
     """
     rmse_list = []
-    for task_idx, phenotype_fname in enumerate( phenotype_fnames ) :
+    for task_idx, all_y_true in enumerate( phenotypes ) :
         #print "\n\n\n\n==== tache num %d" %task_idx
         # For n inds :
         # RMSE = sqrt { (1/n)  [sum from m=1 to n : (ypred_m - ytrue_m)^2 ]  }
 
-        # read all_y_true :
-        #print '\ni read phenotype_fnames[task_idx = %d] = %s' %(task_idx, phenotype_fnames[task_idx]) 
-        with open(phenotype_fname, 'r') as f_true:
-            all_y_true = [float(y) for y in f_true.read().split()]
         #print "\nall_y_true = "
         #print all_y_true
         # read all_y_pred :
@@ -465,7 +857,7 @@ def compute_ridge_selected_RMSE(phenotype_fnames, y_pred_template, xp_indices):
         all_y_pred = list()
 
         num_folds = len(xp_indices)
-        for fold_idx in xrange(num_folds) :
+        for fold_idx in range(num_folds) :
             with open(y_pred_template%(fold_idx, task_idx), 'r') as f_pred:
                 content = f_pred.read().split()
                 all_y_pred.extend(float(y) for y in content)
@@ -483,7 +875,7 @@ def compute_ridge_selected_RMSE(phenotype_fnames, y_pred_template, xp_indices):
         #and don't compute RMSE for this task without using not_NaN_idx
         not_NaN_idx = np.where(~ np.isnan(all_y_pred_sorted) )[0]
         if not not_NaN_idx.size : # if not_NaN_idx empty -> if there is only NaNs in all_y_preds
-            rmse = np.NaN
+            rmse = np.nan
         else : 
             not_NaN_y_true =  [all_y_true[i] for i in not_NaN_idx]
             not_NaN_y_pred_sorted = [all_y_pred_sorted[i] for i in not_NaN_idx]
@@ -496,15 +888,51 @@ def compute_ridge_selected_RMSE(phenotype_fnames, y_pred_template, xp_indices):
     return rmse_list
 
 
+def get_membership_matrix(feature_lists, num_features):
+    """ Encode lists of features as a sparse membership matrix.
+
+    Arguments
+    ---------
+    feature_lists: list of lists
+        List of lists (or arrays) of features, as indices (one list per task).
+    num_features : int
+        Total number of features
+
+    Returns
+    -------
+    membership: (len(feature_lists), num_features) csr_matrix of int32
+        membership[i, j] = 1 if feature j is in feature_lists[i], 0 otherwise.
+        Each row holds as many stored values as distinct features in its list.
+    """
+    sizes = [len(features) for features in feature_lists]
+    indptr = np.zeros(len(sizes) + 1, dtype=np.int32)
+    np.cumsum(sizes, out=indptr[1:])
+    indices = np.concatenate([np.zeros(0, dtype=np.int32)] + \
+                             [np.asarray(features, dtype=np.int32) \
+                              for features in feature_lists])
+    membership = sparse.csr_matrix((np.ones(len(indices), dtype=np.int32), indices, indptr),
+                                   shape=(len(feature_lists), num_features))
+    # Features listed several times count once
+    membership.sum_duplicates()
+    membership.data.fill(1)
+    return membership
+
+
 def evaluate_classification(causal_features, selected_features, num_features):
     """ Compute metrics scoring classification, for all tasks.
 
+    Computed for all tasks at once, from the numbers of true/false positives/negatives,
+    with the same values as sklearn.metrics.accuracy_score, matthews_corrcoef,
+    precision_score and recall_score (0 where they are ill-defined).
+
     Arguments
     ---------
-    causal_features:  list of lists
-        List of lists of real causal features (one list per task).
-    selected_features: list of lists
-        List of lists of selected features (one list per task).
+    causal_features:  list of lists or csr_matrix
+        List of lists of real causal features (one list per task),
+        or their membership matrix (see get_membership_matrix).
+    selected_features: list of lists or csr_matrix
+        List of lists of selected features (one list per task),
+        or their membership matrix (see get_membership_matrix).
     num_features : int
         Total number of features
 
@@ -523,55 +951,98 @@ def evaluate_classification(causal_features, selected_features, num_features):
         List of Recall = Sensitivity =  True Positive Rate (TPR), task per task.
         = TP / (TP + FN)
     """
-    acc_list = []
-    mcc_list = []
-    pre_list = []
-    spe_list = []
-    
-    
-    # For each task, 
-    for task_idx in xrange(len(causal_features)):
-
-        # at the beginning, we consider that the features are 
-        # neither causal...
-        y_true = [False]*num_features
-        # ... nor predicted as such.
-        y_pred = [False]*num_features
-
-        # Then we change the status of the causal ones 
-        # (these are y_true True),
-        for y_true_idx in causal_features[task_idx] :
-            y_true[y_true_idx] = True
-        # and of those that have been predicted as such 
-        # (these are y_pred True). 
-        for y_pred_idx in selected_features[task_idx] :
-            y_pred[y_pred_idx] = True
-
-        # and we compute 
-        #   - accuracy_score
-        #   - matthews_corrcoef
-        #   - precision_score
-        #   - recall_score
-        # based on these 2 sets : 
-        acc_list.append( metrics.accuracy_score    (y_true, y_pred) )
-        mcc_list.append( metrics.matthews_corrcoef (y_true, y_pred) )
-        pre_list.append( metrics.precision_score   (y_true, y_pred) )
-        spe_list.append( metrics.recall_score      (y_true, y_pred) )
-
-    return acc_list, mcc_list, pre_list, spe_list
-
-
-<<<<<<< HEAD
-def compute_ppv_sensitivity(causal_fname, selected_list, num_features):
+    if not sparse.issparse(causal_features):
+        causal_features = get_membership_matrix(causal_features, num_features)
+    if not sparse.issparse(selected_features):
+        selected_features = get_membership_matrix(selected_features, num_features)
+
+    # For each task, numbers of causal features (positives),
+    # of selected features (predicted positives) and of causal selected features
+    # (true positives).
+    num_pos = causal_features.getnnz(axis=1).astype(np.float64)
+    num_pred_pos = selected_features.getnnz(axis=1).astype(np.float64)
+    tp = np.asarray(causal_features.multiply(selected_features).sum(axis=1),
+                    dtype=np.float64).ravel()
+    fp = num_pred_pos - tp
+    fn = num_pos - tp
+    tn = num_features - tp - fp - fn
+
+    acc = (tp + tn) / num_features
+
+    mcc = np.zeros(len(tp))
+    mcc_denom = np.sqrt((tp + fp) * (tp + fn) * (tn + fp) * (tn + fn))
+    valid = (mcc_denom > 0)
+    mcc[valid] = (tp[valid] * tn[valid] - fp[valid] * fn[valid]) / mcc_denom[valid]
+
+    pre = np.zeros(len(tp))
+    valid = (num_pred_pos > 0)
+    pre[valid] = tp[valid] / num_pred_pos[valid]
+
+    spe = np.zeros(len(tp))
+    valid = (num_pos > 0)
+    spe[valid] = tp[valid] / num_pos[valid]
+
+    return acc.tolist(), mcc.tolist(), pre.tolist(), spe.tolist()
+
+
+def evaluate_classification_batched(causal_features, selected_features_list,
+                                    num_features):
+    """ Compute metrics scoring classification, for all tasks and several
+    feature selections at once.
+
+    The membership matrices of all selections are stacked, and compared in a
+    single evaluate_classification call to the causal membership matrix,
+    repeated once per selection.
+
+    Arguments
+    ---------
+    causal_features:  list of lists or csr_matrix
+        List of lists of real causal features (one list per task),
+        or their membership matrix (see get_membership_matrix).
+    selected_features_list: list
+        List of selections (e.g. one per algorithm), each a list of lists of
+        selected features (one list per task) or their membership matrix.
+    num_features : int
+        Total number of features
+
+    Returns
+    -------
+    measures_list: list
+        List of (acc_list, mcc_list, pre_list, spe_list) tuples, one per selection,
+        as returned by evaluate_classification.
+    """
+    if not sparse.issparse(causal_features):
+        causal_features = get_membership_matrix(causal_features, num_features)
+    selected_features_list = [selected_features if sparse.issparse(selected_features) \
+                              else get_membership_matrix(selected_features, num_features) \
+                              for selected_features in selected_features_list]
+
+    num_selections = len(selected_features_list)
+    num_tasks = causal_features.shape[0]
+    measures = evaluate_classification(
+        sparse.vstack([causal_features] * num_selections, format='csr'),
+        sparse.vstack(selected_features_list, format='csr'),
+        num_features)
+
+    # Split each measure list back into one list per selection
+    return [tuple(measure_list[sel_idx*num_tasks:(sel_idx+1)*num_tasks] \
+                  for measure_list in measures) \
+            for sel_idx in range(num_selections)]
+
+
+def compute_ppv_sensitivity(causal_features, selected_list, num_features):
     """ Compute PPV (Positive Predicted Values) = Accuracy = Precision
     and sensitivity (true positive rate) for all tasks.
 
     Arguments
     ---------
-    causal_fname: filename
-        File containing causal features (one line per task, space-separated).
-    selected_list: list of lists
-        List of lists of selected features (one list per task).
+    causal_features: filename, list of lists or csr_matrix
+        File containing causal features (one line per task, space-separated),
+        or, already read, list of lists of causal features (one list per task)
+        or their membership matrix (see get_membership_matrix).
+    selected_list: list of lists or csr_matrix
+        List of lists of selected features (one list per task),
+        or their membership matrix (see get_membership_matrix).
     num_features : int
         Total number of features
 
@@ -584,36 +1055,14 @@ def compute_ppv_sensitivity(causal_fname, selected_list, num_features):
         List of sensitivities (TPR), task per task.
         sensitivities = recall = TP / (TP + FN)
     """
-
-    ppv_list = []
-    tpr_list = []
-    
-    with open(causal_fname, 'r') as f:
-
-        # For each task, 
-        for line_idx, line in enumerate(f):
-
-            # at the beginning, we consider that the features are 
-            # neither causal...
-            y_true = [False]*num_features
-            # ... nor predicted as such.
-            y_pred = [False]*num_features
-
-            # Then we change the status of the causal ones 
-            # (these are y_true True),
-            y_true_indx_list = map(int, line.split())
-            for y_true_indx in y_true_indx_list :
-                y_true[y_true_indx] = True
-            # and of those that have been predicted as such 
-            # (these are y_pred True).
-            y_pred_indx_list = selected_list[line_idx]            
-            for y_pred_indx in y_pred_indx_list :
-                y_pred[y_pred_indx] = True
-
-            # and we compute ppv and tpr based on these 2 sets : 
-            ppv_list.append( metrics.accuracy_score(y_true, y_pred) )
-            tpr_list.append( metrics.recall_score(y_true, y_pred) )
-
+    if isinstance(causal_features, str):
+        with open(causal_features, 'r') as f:
+            causal_features = [np.fromstring(line.strip(), dtype=np.int32, sep=' ') \
+                               for line in f]
+
+    # As computed so far, with accuracy_score
+    ppv_list, _, _, tpr_list = evaluate_classification(causal_features, selected_list,
+                                                       num_features)
     return ppv_list, tpr_list
 
 def extract_res_from_files(f_names, num_tasks, num_repeat, num_folds = None):
@@ -650,7 +1099,7 @@ def extract_res_from_files(f_names, num_tasks, num_repeat, num_folds = None):
     # are per fold, then per task, 
     # we have to compute means per task taking account of value per repeat and per fold. 
         for algo_idx, algo in enumerate(algos) : 
-                val_ci  = [[float() for i in xrange(num_tasks)] for j in xrange(num_repeat)]
+                val_ci  = [[float() for i in range(num_tasks)] for j in range(num_repeat)]
                 # val[num_repeat = num line][num_tasks]
                 with open (f_names[algo_idx], 'r') as f : 
                     for j, line in enumerate(f) : 
@@ -658,7 +1107,7 @@ def extract_res_from_files(f_names, num_tasks, num_repeat, num_folds = None):
                         # content contains every float of the line 
                         # we get values for a task using a slice : 
                         content_task = []
-                        for task_idx in xrange(num_tasks) : 
+                        for task_idx in range(num_tasks) : 
                             content_task.append( np.mean(content[task_idx::num_tasks]) )
 
                         val_ci[j] = content_task
@@ -670,7 +1119,7 @@ def extract_res_from_files(f_names, num_tasks, num_repeat, num_folds = None):
     # each lines = a repeat, each col : a task. 
     # -> means and std in col
         for algo_idx, algo in enumerate(algos) : 
-            val_ci  = [[float() for i in xrange(num_tasks)] for j in xrange(num_repeat)]
+            val_ci  = [[float() for i in range(num_tasks)] for j in range(num_repeat)]
             # val[num_repeat = num line][num_tasks = num column]
             with open (f_names[algo_idx], 'r') as f : 
                 for j, line in enumerate(f) : 
@@ -683,6 +1132,216 @@ def extract_res_from_files(f_names, num_tasks, num_repeat, num_folds = None):
     return means, std
 
 
+def get_indices_archive_fname(out_dir, simu_id):
+    """ Give the name of the archive holding the cross-validation folds
+    and subsample indices of a repeat.
+
+    Parameters
+    ----------
+    out_dir : dir path
+        Directory where the indices are saved.
+    simu_id : string
+        Name of the simulation, used to name files.
+
+    Returns
+    -------
+    fname : filename
+        <out_dir>/<simu_id>.indices.npz
+    """
+    return '%s/%s.indices.npz' % (out_dir, simu_id)
+
+
+def save_indices_archive(fname, xp_indices):
+    """ Save cross-validation folds and subsample indices to a single .npz archive.
+
+    Parameters
+    ----------
+    fname : filename
+        Path to the archive.
+    xp_indices : list of dictionaries
+        fold_idx
+        {
+            'trIndices': (int32 array) train indices,
+            'teIndices': (int32 array) test indices,
+            'ssIndices': list of (int32 array) subsample indices
+        }
+
+    Side effects
+    ------------
+    Create the archive fname, holding one array per list of indices,
+    named trIndices_<fold_idx>, teIndices_<fold_idx> and ssIndices_<fold_idx>_<ss_idx>.
+    """
+    arrays = {}
+    for fold_idx, fold in enumerate(xp_indices):
+        arrays['trIndices_%d' % fold_idx] = fold['trIndices']
+        arrays['teIndices_%d' % fold_idx] = fold['teIndices']
+        for ss_idx, ss_indices in enumerate(fold['ssIndices']):
+            arrays['ssIndices_%d_%d' % (fold_idx, ss_idx)] = ss_indices
+    # Write to a file object so that np.savez does not append a second extension
+    with open(fname, 'wb') as f:
+        np.savez(f, **arrays)
+
+
+def load_indices_archive(fname, num_folds, num_subsamples):
+    """ Load cross-validation folds and subsample indices from a .npz archive.
+
+    Parameters
+    ----------
+    fname : filename
+        Path to the archive, as written by save_indices_archive.
+    num_folds : int
+        Number of cross-validation folds.
+    num_subsamples : int
+        Number of subsamples.
+
+    Returns
+    -------
+    xp_indices : list of dictionaries
+        fold_idx
+        {
+            'trIndices': (int32 array) train indices,
+            'teIndices': (int32 array) test indices,
+            'ssIndices': list of (int32 array) subsample indices
+        }
+    """
+    archive = np.load(fname)
+    return [{'trIndices': archive['trIndices_%d' % fold_idx],
+             'teIndices': archive['teIndices_%d' % fold_idx],
+             'ssIndices': [archive['ssIndices_%d_%d' % (fold_idx, ss_idx)] \
+                           for ss_idx in range(num_subsamples)]} \
+            for fold_idx in range(num_folds)]
+
+
+def is_cache_valid(cache_fname, source_fnames):
+    """ Check whether a cache file is more recent than the files it was built from.
+
+    Parameters
+    ----------
+    cache_fname : filename
+        Path to the cache file.
+    source_fnames : list of filenames
+        Paths to the files the cache was built from.
+
+    Returns
+    -------
+    valid : boolean
+        True if the cache file exists and was not modified before any of the source files.
+    """
+    if not os.path.isfile(cache_fname):
+        return False
+    return os.stat(cache_fname).st_mtime >= \
+        max(os.stat(fname).st_mtime for fname in source_fnames)
+
+
+def get_selected_features_npy_fname(fname):
+    """ Give the name of the binary copy of a selected features file.
+
+    Parameters
+    ----------
+    fname : filename
+        Path to the selected features (text) file.
+
+    Returns
+    -------
+    npy_fname : filename
+        <fname>.npy
+    """
+    return fname + '.npy'
+
+
+def save_selected_features(fname, sel_list):
+    """ Save the features selected for each task, as text and as a binary array.
+
+    Parameters
+    ----------
+    fname : filename
+        Path to the selected features (text) file.
+    sel_list : list of lists
+        For each task, list of selected features.
+
+    Side effects
+    ------------
+    Create fname, holding one line per task, made of the space-separated list
+    of its selected features.
+    Create <fname>.npy, holding a (num_tasks, max. number of selected features)
+    int32 array: the selected features of each task, padded with -1.
+    """
+    with open(fname, 'w') as f:
+        for selected_features_list in sel_list:
+            f.write("%s\n" % ' '.join(str(x) for x in selected_features_list))
+
+    max_num_selected = max([len(sel) for sel in sel_list] + [0])
+    selected = np.full((len(sel_list), max_num_selected), -1, dtype=np.int32)
+    for task_idx, sel in enumerate(sel_list):
+        selected[task_idx, :len(sel)] = sel
+    # Write to a file object so that np.save does not append a second extension
+    with open(get_selected_features_npy_fname(fname), 'wb') as f:
+        np.save(f, selected)
+
+
+def load_selected_features_npy(npy_fname):
+    """ Load the features selected for each task from the binary copy
+    written by save_selected_features.
+
+    Parameters
+    ----------
+    npy_fname : filename
+        Path to the <selected features file>.npy array.
+
+    Returns
+    -------
+    sel_list : list of arrays
+        For each task, (int32) array of selected features.
+    """
+    selected = np.load(npy_fname)
+    return [sel[sel >= 0] for sel in selected]
+
+
+def read_indices(out_dir, simu_id, num_folds, num_subsamples):
+    """ Read the cross-validation folds and subsample indices of a repeat.
+
+    Read the archive <out_dir>/<simu_id>.indices.npz if it exists,
+    and the text files written by previous versions of Framework.save_indices otherwise.
+
+    Parameters
+    ----------
+    out_dir : dir path
+        Directory where the indices were saved.
+    simu_id : string
+        Name of the simulation, used to name files.
+    num_folds : int
+        Number of cross-validation folds.
+    num_subsamples : int
+        Number of subsamples.
+
+    Returns
+    -------
+    xp_indices : list of dictionaries
+        fold_idx
+        {
+            'trIndices': (int32 array) train indices,
+            'teIndices': (int32 array) test indices,
+            'ssIndices': list of (int32 array) subsample indices
+        }
+    """
+    archive_fname = get_indices_archive_fname(out_dir, simu_id)
+    if os.path.isfile(archive_fname):
+        return load_indices_archive(archive_fname, num_folds, num_subsamples)
+
+    fold_prefix = out_dir + '/' + simu_id + '.fold%d'
+    xp_indices = []
+    for fold_idx in range(num_folds):
+        xp_indices.append({
+            'trIndices': np.loadtxt(fold_prefix % fold_idx + '.trIndices',
+                                    dtype=np.int32, ndmin=1),
+            'teIndices': np.loadtxt(fold_prefix % fold_idx + '.teIndices',
+                                    dtype=np.int32, ndmin=1),
+            'ssIndices': [np.loadtxt(fold_prefix % fold_idx + '.ss%d.ssIndices' % ss_idx,
+                                     dtype=np.int32, ndmin=1) \
+                          for ss_idx in range(num_subsamples)]})
+    return xp_indices
+
+
 class Framework(object):
     """ Setting up evaluation framework.
 
@@ -697,9 +1356,9 @@ class Framework(object):
     self.xp_indices: list of dictionaries
         fold_idx
         {
-            'trIndices': list of train indices,
-            'teIndices': list of test indices,
-            'ssIndices': list of list of subsample indices
+            'trIndices': (int32 array) train indices,
+            'teIndices': (int32 array) test indices,
+            'ssIndices': list of (int32 array) subsample indices
         }
 
     """
@@ -717,7 +1376,7 @@ class Framework(object):
         self.num_samples = num_samples
         self.num_folds = num_folds
         self.num_subsamples = num_subsamples
-        self.xp_indices = [{'trIndices': list(), 'teIndices':list(), 'ssIndices':list()} for fold in xrange(num_folds)]
+        self.xp_indices = [{'trIndices': list(), 'teIndices':list(), 'ssIndices':list()} for fold in range(num_folds)]
         
     def compute_indices(self, seed=None):
         """ Compute the cross-validation folds and subsample indices.
@@ -733,28 +1392,31 @@ class Framework(object):
         xp_indices: list of dictionaries
             fold_idx
             {
-                'trIndices': list of train indices,
-                'teIndices': list of test indices,
-                'ssIndices': list of list of subsample indices
+                'trIndices': (int32 array) train indices,
+                'teIndices': (int32 array) test indices,
+                'ssIndices': list of (int32 array) subsample indices
             }
         """
-        # use sklearn.cross_validation
+        # use sklearn.model_selection
         kf = model_selection.KFold(n_splits=self.num_folds, shuffle=True,
                                    random_state=seed).split(np.zeros(self.num_samples))
+        # subsamples are drawn from the same seed
+        rng = np.random.RandomState(seed)
 
         for fold_idx, (train_indices_f, test_indices_f) in enumerate(kf):
-            #print fold_idx, train_indices_f, test_indices_f
             # Generate cross-validation indices
-            self.xp_indices[fold_idx]['trIndices'] = train_indices_f.tolist()
-            self.xp_indices[fold_idx]['teIndices'] = test_indices_f.tolist()
+            train_indices_f = train_indices_f.astype(np.int32)
+            self.xp_indices[fold_idx]['trIndices'] = train_indices_f
+            self.xp_indices[fold_idx]['teIndices'] = test_indices_f.astype(np.int32)
             # For each train set, generate self.num_subsamples subsample sets of indices (90% of the train_set_f)
-            for i_ss in xrange(self.num_subsamples) : 
-                train_indices_ss, test_indices_ss = model_selection.train_test_split(train_indices_f,
-                                                                                     train_size=0.9)
-                self.xp_indices[fold_idx]['ssIndices'].append( train_indices_ss.tolist() ) 
+            num_ss_samples = int(0.9 * train_indices_f.shape[0])
+            self.xp_indices[fold_idx]['ssIndices'] = [rng.choice(train_indices_f,
+                                                                 size=num_ss_samples,
+                                                                 replace=False) \
+                                                      for i_ss in range(self.num_subsamples)]
 
         
-    def save_indices(self, out_dir, simu_id):
+    def save_indices(self, out_dir, simu_id, legacy_text=False):
         """ Save the cross-validation folds and subsample indices to files.
 
         Parameters
@@ -763,10 +1425,16 @@ class Framework(object):
             fold where indices have to be saved
         simu_id :  string
             Name of the simulation, to be used to name files.
+        legacy_text : boolean, optional
+            If true, also save the indices as text files (one file per list of indices).
         
         Generated files
         ---------------
-        For each fold_idx:
+        <out_dir>/<simu_id>.indices.npz:
+            All indices, as int32 arrays named trIndices_<fold_idx>,
+            teIndices_<fold_idx> and ssIndices_<fold_idx>_<ss_idx>.
+            See save_indices_archive / load_indices_archive.
+        If legacy_text, for each fold_idx:
             <out_dir>/<simu_id>.fold<fold_idx>.trIndices:
                 Space-separated list of training indices.
             <out_dir>/<simu_id>.fold<fold_idx>.teIndices:
@@ -776,18 +1444,19 @@ class Framework(object):
                     Space-separated lists of subsample indices,
                     one line per list / subsample.
         """
-        # use np.savetxt ??? why ? 
+        save_indices_archive(get_indices_archive_fname(out_dir, simu_id), self.xp_indices)
+        if not legacy_text:
+            return
+
         trIndices_fname = out_dir+'/'+simu_id+'.fold%d.trIndices'
         teIndices_fname = out_dir+'/'+simu_id+'.fold%d.teIndices'
         ssIndices_fname = out_dir+'/'+simu_id+'.fold%d.ss%d.ssIndices'
-        for fold_idx in xrange(self.num_folds) : 
-            with open(trIndices_fname %(fold_idx), 'w') as trIndices_f : 
-                trIndices_f.write(  " ".join(str(i) for i in self.xp_indices[fold_idx]["trIndices"] ) )
-            #np.savetxt(trIndices_fname %(fold_idx), self.xp_indices[fold_idx]["trIndices"], delimiter=' ', fmt='%d')
-            with open(teIndices_fname %(fold_idx),'w') as teIndices_f : 
-                teIndices_f.write(  " ".join(str(i) for i in self.xp_indices[fold_idx]["teIndices"] ) )
-            #np.savetxt(teIndices_fname %(fold_idx), self.xp_indices[fold_idx]["teIndices"], delimiter=' ', fmt='%d')
-            for ss_idx in xrange(self.num_subsamples) :
-                with open(ssIndices_fname  %(fold_idx,ss_idx), 'w') as ssIndices_f:
-                    ssIndices_f.write(  " ".join(str(i) for i in self.xp_indices[fold_idx]["ssIndices"][ss_idx] ) )
-                #np.savetxt(ssIndices_fname  %(fold_idx,ss_idx), self.xp_indices[fold_idx]["ssIndices"][ss_idx], delimiter=' ', fmt='%d')
+        for fold_idx in range(self.num_folds) : 
+            np.savetxt(trIndices_fname %(fold_idx),
+                       self.xp_indices[fold_idx]["trIndices"].reshape(1, -1), fmt='%d')
+            np.savetxt(teIndices_fname %(fold_idx),
+                       self.xp_indices[fold_idx]["teIndices"].reshape(1, -1), fmt='%d')
+            for ss_idx in range(self.num_subsamples) :
+                np.savetxt(ssIndices_fname %(fold_idx,ss_idx),
+                           self.xp_indices[fold_idx]["ssIndices"][ss_idx].reshape(1, -1),
+                           fmt='%d')
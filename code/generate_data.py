@@ -1,12 +1,12 @@
 """ generate_data.py: Generate test data for multitask_sfan.
 """
+from __future__ import division, print_function
 
 import argparse
 import logging
 import numpy as np
 import os
 import tables as tb
-import scipy.stats as st 
 import sys
 
 NUM_CAUSAL_TOTAL = 30 # total number of causal features
@@ -14,6 +14,139 @@ NUM_CAUSAL_EACH = 20 # how many of these features are causal for each task
 MOD_SIZE = 15 # number of nodes in each fully connected module of the network.
 
 
+# Genotypes take values in {0, 1, 2} and are stored on 2 bits:
+# 4 samples per byte, the first sample in the highest bits.
+GENOTYPES_PER_BYTE = 4
+# Values of the 4 genotypes packed in each possible byte
+UNPACK_TABLE = np.array([[(byte >> shift) & 3 for shift in (6, 4, 2, 0)] \
+                         for byte in range(256)], dtype=np.int8)
+
+
+def pack_genotypes(X):
+    """ Pack a genotype matrix, 4 samples per byte.
+
+    Parameters
+    ----------
+    X: (num_features, num_samples) array of {0, 1, 2}
+        Genotypes.
+
+    Returns
+    -------
+    packed: (num_features, ceil(num_samples / 4)) array of uint8
+        Packed genotypes. Missing samples of the last byte are padded with 0.
+    """
+    num_features, num_samples = X.shape
+    num_bytes = -(-num_samples // GENOTYPES_PER_BYTE)
+    padded = np.zeros((num_features, num_bytes * GENOTYPES_PER_BYTE), dtype=np.uint8)
+    padded[:, :num_samples] = X
+    return (padded[:, 0::4] << 6) | (padded[:, 1::4] << 4) | \
+        (padded[:, 2::4] << 2) | padded[:, 3::4]
+
+
+def unpack_genotypes(packed, num_samples):
+    """ Unpack a genotype matrix packed by pack_genotypes.
+
+    Parameters
+    ----------
+    packed: (num_features, num_bytes) array of uint8
+        Packed genotypes.
+    num_samples: int
+        Number of samples.
+
+    Returns
+    -------
+    X: (num_features, num_samples) array of int8
+        Genotypes.
+    """
+    return UNPACK_TABLE[packed].reshape(packed.shape[0], -1)[:, :num_samples]
+
+
+def read_genotypes(genotype_fname, feature_indices=None):
+    """ Read genotypes saved by generate_modular.
+
+    Genotypes saved by previous versions of generate_modular,
+    as an Xtr array of int8, are also supported.
+
+    Parameters
+    ----------
+    genotype_fname: filename
+        Path to the genotypes (PyTables file).
+    feature_indices: {list of int, None}, optional
+        Indices of the features to read. All features are read by default.
+
+    Returns
+    -------
+    X: (num_features, num_samples) array of int8
+        Genotypes. Features are in lines, samples in columns.
+    """
+    with tb.open_file(genotype_fname, 'r') as h5f:
+        if 'Xtr_packed' in h5f.root:
+            table = h5f.root.Xtr_packed
+        else:
+            table = h5f.root.Xtr
+        if feature_indices is None:
+            X = table[:, :]
+        else:
+            X = table[feature_indices, :]
+        if table.name == 'Xtr_packed':
+            X = unpack_genotypes(X, table.attrs.num_samples)
+    return X
+
+
+def get_bundle_fname(root_dir, simu_id):
+    """ Give the name of the archive of the arrays saved by generate_modular.
+
+    Parameters
+    ----------
+    root_dir: dir path
+        Directory of the simulated data.
+    simu_id: string
+        Name of the simulation.
+
+    Returns
+    -------
+    fname: filename
+        <root_dir>/<simu_id>.bundle.npz
+    """
+    return '%s/%s.bundle.npz' % (root_dir, simu_id)
+
+
+def read_causal_features_and_phenotypes(root_dir, simu_id, num_tasks):
+    """ Read the causal features and phenotypes saved by generate_modular.
+
+    Read the archive <root_dir>/<simu_id>.bundle.npz if it exists,
+    and the text files saved with legacy_text (or by previous versions
+    of generate_modular) otherwise.
+
+    Parameters
+    ----------
+    root_dir: dir path
+        Directory of the simulated data.
+    simu_id: string
+        Name of the simulation.
+    num_tasks: int
+        Number of tasks.
+
+    Returns
+    -------
+    causal_features: (num_tasks, NUM_CAUSAL_EACH) array of int
+        Causal features of each task. Indices start at 0.
+    Y: (num_tasks, num_samples) array
+        Phenotypes of each task.
+    """
+    bundle_fname = get_bundle_fname(root_dir, simu_id)
+    if os.path.isfile(bundle_fname):
+        with np.load(bundle_fname) as bundle:
+            return bundle['causal_features'], bundle['Y']
+
+    causal_features = np.loadtxt('%s/%s.causal_features.txt' % (root_dir, simu_id),
+                                 dtype=int, ndmin=2)
+    Y = np.array([np.loadtxt('%s/%s.phenotype_%d.txt' % (root_dir, simu_id, task_idx),
+                             ndmin=1) \
+                  for task_idx in range(num_tasks)])
+    return causal_features, Y
+
+
 class SyntheticDataGenerator(object):
     """ Class for the generation of synthetic data.
 
@@ -29,8 +162,11 @@ class SyntheticDataGenerator(object):
         Path of the directory in which to save the simulated data.
     simu_id: string
         Name of the simulation, to be used to name files within args.root_dir.
+    random_state: np.random.RandomState
+        Random number generator used to generate the data.
     """
-    def __init__(self, num_tasks, num_features, num_samples, root_dir, simu_id):
+    def __init__(self, num_tasks, num_features, num_samples, root_dir, simu_id,
+                 seed=None):
         """
         Parameters
         ----------
@@ -44,12 +180,16 @@ class SyntheticDataGenerator(object):
             Path of the directory in which to save the simulated data.
         simu_id: string
             Name of the simulation, to be used to name files within args.root_dir.
+        seed: {int, None}, optional
+            Random seed.
+            The same data is generated with the same random seed.
         """
         self.num_tasks = num_tasks
         self.num_features = num_features
         self.num_samples = num_samples
         self.root_dir = root_dir
         self.simu_id = simu_id
+        self.random_state = np.random.RandomState(seed)
 
         # Create simulated data repository if it does not exist
         if not os.path.isdir(self.root_dir):
@@ -61,38 +201,61 @@ class SyntheticDataGenerator(object):
                     raise
     
     
-    def generate_modular(self):
+    def generate_modular(self, legacy_text=False):
         """
         Generate synthetic data with a modular network and a genotype matrix
         made of random {0, 1, 2}.
+
+        Parameters
+        ----------
+        legacy_text: {bool}, optional
+            Also save the causal features, causal weights and phenotypes
+            as text files (as previous versions did).
+            By default, they are only saved to <root_dir>/<simu_id>.bundle.npz
+            (see read_causal_features_and_phenotypes).
         
         Generated files
         ---------------
         <root_dir>/<simu_id>.readme:
             README file describing the simulation paramters.
+        <root_dir>/<simu_id>.bundle.npz:
+            Compressed numpy archive of
+            'omega_inv': args.num_tasks x args.num_tasks inverse of \Omega
+                (precision matrix between tasks);
+            'beta': args.num_tasks x NUM_CAUSAL_TOTAL weights of the
+                causal features (0 for non-causal features);
+            'causal_features': args.num_tasks x NUM_CAUSAL_EACH causal features,
+                chosen from the first NUM_CAUSAL_TOTAL features.
+                Indices start at 0;
+            'Y': args.num_tasks x args.num_samples phenotypes;
+            'r2': args.num_tasks x args.num_features node weights
+                (squared Pearson correlations).
         <root_dir>/<simu_id>.task_similarities.txt:
             args.num_tasks x args.num_tasks matrix \Omega
             of task covariance.
-        <root_dir>/<simu_id>.causal_features:
+        <root_dir>/<simu_id>.causal_features (only if legacy_text):
             args.num_tasks lists of NUM_CAUSAL_EACH causal features,
             chosen from the first NUM_CAUSAL_TOTAL features.
             One list per task. Indices start at 0.
-        <root_dir>/<simu_id>.causal_weights:
+        <root_dir>/<simu_id>.causal_weights (only if legacy_text):
             Lists of the weights given to the causal features,
             generated so as to respect the covariance structure given by Omega.
             One list per task, in the order of <simu_id>.causal_features.
         <root_dir>/<simu_id>.genotypes.txt:
-            num_features x num_samples matrix of {0, 1, 2} (representing SNPs).
+            num_features x num_samples matrix of {0, 1, 2} (representing SNPs),
+            packed 4 samples per byte (see read_genotypes).
         <root_dir>/<simu_id>.network.dimacs:
             A modular network over the self.num_features features,
             with fully connected modules of size MOD_SIZE.
         For task_id in 0, ..., args.num_tasks:
-            <root_dir>/<simu_id>.phenotype_<task_id>.txt:
+            <root_dir>/<simu_id>.phenotype_<task_id>.txt (only if legacy_text):
                 Phenotype vector (of size args.num_samples) for task <task_id>.
             <root_dir>/<simu_id>.scores_<task_id>.txt
                 Node weights (of size args.num_features) for task <task_id>.
                 Computed as Pearson correlation.
         """
+        saved_fnames = []
+
         # Writing readme
         readme_f = '%s/%s.readme' % (self.root_dir, self.simu_id)
         with open(readme_f, 'w') as f:
@@ -101,10 +264,10 @@ class SyntheticDataGenerator(object):
             f.write("%d\tsamples\n" % self.num_samples)
             f.write("%d\ttasks\n" % self.num_tasks)
             f.close()
-        logging.info("README file created under %s\n" % readme_f)
+        saved_fnames.append(readme_f)
 
         # Generate a matrix of similarities between tasks
-        omega = np.random.uniform(size = (self.num_tasks, self.num_tasks))
+        omega = self.random_state.uniform(size = (self.num_tasks, self.num_tasks))
         omega = omega.transpose().dot(omega)
         d = np.diag(omega)
         d.shape = (self.num_tasks, 1)
@@ -113,99 +276,143 @@ class SyntheticDataGenerator(object):
         # Save omega to file
         fname = "%s/%s.task_similarities.txt" % (self.root_dir, self.simu_id)
         np.savetxt(fname, omega, fmt='%.3f')
-        logging.info("Covariance matrix saved under %s\n" % fname)
+        saved_fnames.append(fname)
 
         # Generate beta vectors that are correlated according to omega
         # Trick: cov(Ax) = Acov(x)A'
         L = np.linalg.cholesky(omega) # i.e. LL' = omega
-        b = np.random.normal(size=(self.num_tasks, NUM_CAUSAL_TOTAL))
+        b = self.random_state.standard_normal(size=(self.num_tasks, NUM_CAUSAL_TOTAL))
         beta = L.dot(b)
 
         # For each task, keep the NUM_CAUSAL_EACH features with highest weight
         # as causal;
         # drop the weight of the others to 0.
-        causal_features = []
-        for k in range(self.num_tasks):
-            b = [x for x in beta[k, :]]
-            b.sort()
-            causal_features.append(np.where(beta[k, :] >= b[-NUM_CAUSAL_EACH])[0])
-            beta[k, np.where(beta[k, :] < b[-NUM_CAUSAL_EACH])[0]] = 0.
-
-        # Save causal features to file
-        fname = "%s/%s.causal_features.txt"  % (self.root_dir, self.simu_id)
-        np.savetxt(fname, causal_features, fmt='%d')
-        logging.info("Causal features saved under %s\n" % fname)
-
-        # Save beta to file
-        fname = "%s/%s.causal_weights.txt"  % (self.root_dir, self.simu_id)
-        np.savetxt(fname, beta)
-        logging.info("Causal weights saved under %s\n" % fname)
+        top_idx = np.argpartition(-beta, NUM_CAUSAL_EACH - 1,
+                                  axis=1)[:, :NUM_CAUSAL_EACH]
+        is_causal = np.zeros(beta.shape, dtype=bool)
+        np.put_along_axis(is_causal, top_idx, True, axis=1)
+        beta[~is_causal] = 0.
+        causal_features = np.sort(top_idx, axis=1)
+
+        if legacy_text:
+            # Save causal features to file
+            fname = "%s/%s.causal_features.txt"  % (self.root_dir, self.simu_id)
+            np.savetxt(fname, causal_features, fmt='%d')
+            saved_fnames.append(fname)
+
+            # Save beta to file
+            fname = "%s/%s.causal_weights.txt"  % (self.root_dir, self.simu_id)
+            np.savetxt(fname, beta)
+            saved_fnames.append(fname)
 
         # Generate genotypes
         # Create PyTables structure for X transposed (so as to access rows, not cols)
         fname = "%s/%s.genotypes.txt"  % (self.root_dir, self.simu_id)
+        # Genotypes are packed 4 samples per byte (see pack_genotypes)
+        num_bytes = -(-self.num_samples // GENOTYPES_PER_BYTE)
+        # Rows are generated by blocks of about 1MB, one chunk of the carray each
+        block_size = max(1, (1 << 20) // self.num_samples)
         with tb.open_file(fname, 'w') as h5f:
-            filters = tb.Filters(complevel=5, complib='blosc')
-            Xtr = h5f.create_carray(h5f.root, 'Xtr', tb.Int8Atom(),
-                                    shape=(self.num_features, self.num_samples))
-            for row in xrange(self.num_features):
-                Xtr[row, :] = np.random.random_integers(0, high=2, size=self.num_samples)
+            filters = tb.Filters(complevel=1, complib='blosc:lz4',
+                                 shuffle=False, bitshuffle=True)
+            Xtr = h5f.create_carray(h5f.root, 'Xtr_packed', tb.UInt8Atom(),
+                                    shape=(self.num_features, num_bytes),
+                                    filters=filters,
+                                    chunkshape=(min(block_size, self.num_features),
+                                                num_bytes))
+            Xtr.attrs.num_samples = self.num_samples
+            for start in range(0, self.num_features, block_size):
+                stop = min(start + block_size, self.num_features)
+                X_block = self.random_state.randint(0, 3,
+                                                    size=(stop - start, self.num_samples),
+                                                    dtype=np.int8)
+                Xtr[start:stop, :] = pack_genotypes(X_block)
             h5f.close()
-        logging.info("Genotypes saved under %s\n" % fname)
+        saved_fnames.append(fname)
 
         # generate phenotypes and Pearson scores, and save to file
-        with tb.open_file(fname, 'r') as h5f:
-            Xtr = h5f.root.Xtr
-            for task_idx in range(self.num_tasks):
-                y = Xtr[:NUM_CAUSAL_TOTAL,:].transpose().dot(beta.transpose()[:,
-                                                                              task_idx])
-                y += np.random.normal(scale=0.1, size=(self.num_samples, ))
+        Xtr = read_genotypes(fname)
+
+        # Phenotypes of all tasks at once
+        Y = beta.dot(Xtr[:NUM_CAUSAL_TOTAL, :])
+        noise = self.random_state.standard_normal(size=Y.shape)
+        noise *= 0.1
+        Y += noise
+
+        # compute feature-phenotype correlations for all tasks at once
+        Xc = Xtr.astype(np.float32)
+        Xc -= Xc.mean(axis=1, keepdims=True)
+        sx = np.sqrt((Xc * Xc).sum(axis=1))
+        Yc = (Y - Y.mean(axis=1, keepdims=True)).astype(np.float32)
+        sy = np.sqrt((Yc * Yc).sum(axis=1))
+        r2_all = (Yc.dot(Xc.T) / np.outer(sy, sx))**2
+
+        for task_idx in range(self.num_tasks):
+            if legacy_text:
                 fname = "%s/%s.phenotype_%d.txt" % (self.root_dir,
                                                     self.simu_id, task_idx)
-                np.savetxt(fname, y, fmt='%.3f')
-                logging.info("Phenotype for task %d saved under %s\n" % (task_idx,
-                                                                         fname))
+                np.savetxt(fname, Y[task_idx, :], fmt='%.3f')
+                saved_fnames.append(fname)
 
-                # compute feature-phenotype correlations
-                r2 = [st.pearsonr(Xtr[feat_idx, :].transpose(), y)[0]**2 \
-                      for feat_idx in range(self.num_features)]
-                fname = "%s/%s.scores_%d.txt" % (self.root_dir, self.simu_id, task_idx)
-                np.savetxt(fname, r2, fmt='%.3e')
-                logging.info("Node weights for task %d saved under %s\n" % (task_idx,
-                                                                            fname))
+            # Node weights are read by multitask_sfan: always saved as text
+            fname = "%s/%s.scores_%d.txt" % (self.root_dir, self.simu_id, task_idx)
+            np.savetxt(fname, r2_all[task_idx, :], fmt='%.3e')
+            saved_fnames.append(fname)
+
+        # Save all arrays to a single archive
+        fname = get_bundle_fname(self.root_dir, self.simu_id)
+        np.savez_compressed(fname, omega_inv=np.linalg.inv(omega), beta=beta,
+                            causal_features=causal_features, Y=Y, r2=r2_all)
+        saved_fnames.append(fname)
 
 
         # Generate network in dimacs format
         # Careful: node indices must start at 1
-        num_modules = self.num_features / MOD_SIZE
+        num_modules = self.num_features // MOD_SIZE
         num_edges = MOD_SIZE * (MOD_SIZE - 1) * num_modules + \
                     2 * (num_modules - 1) + 2 * (self.num_features - \
                                                  MOD_SIZE * num_modules)
+        # Edges of a fully connected module whose first node is 1
+        module_arcs = np.array([(x_idx1 + 1, x_idx2 + 1) \
+                                for x_idx1 in range(MOD_SIZE) \
+                                for x_idx2 in range(MOD_SIZE) if x_idx1 != x_idx2])
+
+        # For each module: connection to the previous module,
+        # fully connected module, connection to the next module
+        arcs = np.empty((num_modules, module_arcs.shape[0] + 2, 2), dtype=int)
+        offsets = np.arange(num_modules) * MOD_SIZE
+        arcs[:, 0, 0] = offsets + 1
+        arcs[:, 0, 1] = offsets
+        arcs[:, 1:-1, :] = module_arcs[None, :, :] + offsets[:, None, None]
+        arcs[:, -1, 0] = offsets + MOD_SIZE
+        arcs[:, -1, 1] = offsets + MOD_SIZE + 1
+        keep = np.ones(arcs.shape[:2], dtype=bool)
+        keep[0, 0] = False # no module before the first one
+        if MOD_SIZE * num_modules == self.num_features:
+            keep[-1, -1] = False # no node after the last module
+        arcs = [arcs[keep]]
+
+        # connect each of the remaining nodes to its neighbor
+        # (the connection from the last module was added above)
+        remaining = np.arange(MOD_SIZE * num_modules + 1, self.num_features)
+        arcs.append(np.column_stack((np.repeat(remaining, 2),
+                                     np.repeat(remaining, 2) + \
+                                     np.tile([-1, 1], remaining.shape[0]))))
+        # last connection (mirror from the previous one)
+        if MOD_SIZE * num_modules < self.num_features:
+            arcs.append(np.array([[self.num_features, self.num_features - 1]]))
+        arcs = np.concatenate(arcs)
+
         dimacs_f = '%s/%s.network.dimacs' % (self.root_dir, self.simu_id)
         with open(dimacs_f, 'w') as g:
             g.write("p max %d %d\n" % ((self.num_features), num_edges))
-
-            # create fully connected modules of size MOD_SIZE
-            # connect each to the next one
-            for mod_idx in range(num_modules):
-                x = mod_idx * MOD_SIZE
-                if mod_idx > 0:
-                    g.write("a %d %d 1\n" % ((x+1), (x))) # connect to previous module
-                for x_idx1 in range(MOD_SIZE):
-                    for x_idx2 in range(MOD_SIZE):
-                        if x_idx1 != x_idx2:
-                            g.write("a %d %d 1\n" % ((x+x_idx1+1), (x+x_idx2+1)))
-                if (x+MOD_SIZE) < self.num_features: # connect to next module
-                    g.write("a %d %d 1\n" % ((x+MOD_SIZE), (x+MOD_SIZE+1)))
-            # connect each of the remaining nodes to its neighbor
-            for x_idx in range(x+MOD_SIZE+1, self.num_features):
-                g.write("a %d %d 1\n" % ((x_idx), (x_idx-1)))
-                g.write("a %d %d 1\n" % ((x_idx), (x_idx+1)))
-            # last connection (mirror from the previous one)
-            g.write("a %d %d 1\n" % ((x_idx+1), (x_idx)))
-
+            g.write(("a %d %d 1\n" * arcs.shape[0]) % tuple(arcs.ravel()))
             g.close()
-        logging.info("Network saved under %s\n" % fname)
+        saved_fnames.append(dimacs_f)
+
+        logging.info("Simulated data saved under %s: %s\n" % \
+                     (self.root_dir, " ".join(os.path.basename(fname) \
+                                              for fname in saved_fnames)))
 
 
 
@@ -234,17 +441,25 @@ def main():
         Path of the directory in which to save the simulated data.
     args.simu_id: string
         Name of the simulation, to be used to name files within args.root_dir.
+    args.seed: {int, None}, optional
+        Random seed.
+    args.legacy_text: bool
+        Whether to also save causal features, causal weights and phenotypes
+        as text files.
 
     Generated files
     ---------------
     <root_dir>/<simu_id>.readme:
         README file describing the simulation paramters
+    <root_dir>/<simu_id>.bundle.npz:
+        Task precision matrix, causal weights, causal features, phenotypes
+        and node weights, in a single compressed numpy archive.
     <root_dir>/<simu_id>.task_similarities.txt:
         Matrix of covariance between tasks
-    <root_dir>/<simu_id>.causal_features:
+    <root_dir>/<simu_id>.causal_features (only with --legacy-text):
         Lists of causal features.
         One list per task. Indices start at 0.
-    <root_dir>/<simu_id>.causal_weights:
+    <root_dir>/<simu_id>.causal_weights (only with --legacy-text):
         Lists of the weights given to the causal features.
         One list per task. Same order as in <root_dir>/<simu_id>.causal_features.
     <root_dir>/<simu_id>.genotypes.txt:
@@ -252,7 +467,7 @@ def main():
     <root_dir>/<simu_id>.network.dimacs:
         Network over the features.
     For task_id in 0, ..., args.num_tasks:
-        <root_dir>/<simu_id>.phenotype_<task_id>.txt:
+        <root_dir>/<simu_id>.phenotype_<task_id>.txt (only with --legacy-text):
             Phenotype (outcome) vector (of size args.num_samples) for task <task_id>.
         <root_dir>/<simu_id>.scores_<task_id>.txt
             Node weights (of size args.num_features) for task <task_id>.
@@ -270,6 +485,10 @@ def main():
     parser.add_argument("-k", "--num_tasks", help="Number of tasks", type=int)
     parser.add_argument("-m", "--num_features", help="Number of features", type=int)
     parser.add_argument("-n", "--num_samples", help="Number of samples", type=int)
+    parser.add_argument("-s", "--seed", help="Random seed", type=int)
+    parser.add_argument("--legacy-text", help="Also save causal features, " + \
+                        "causal weights and phenotypes as text files",
+                        action='store_true')
     parser.add_argument("-v", "--verbose", help="Turn on more detailed info log",
                         action='store_true')
     parser.add_argument("root_dir", help="Simulated data directory")
@@ -309,10 +528,11 @@ def main():
     # Instantiate data generator
     data_gen = SyntheticDataGenerator(args.num_tasks, args.num_features,
                                       args.num_samples,
-                                      args.root_dir, args.simu_id)
+                                      args.root_dir, args.simu_id,
+                                      seed=args.seed)
 
     # Generate modular data
-    data_gen.generate_modular()
+    data_gen.generate_modular(legacy_text=args.legacy_text)
         
 
 if __name__ == "__main__":
@@ -1,9 +1,351 @@
 # -*- coding: utf-8 -*-
+from __future__ import division, print_function
 import synthetic_data_experiments as sde
 import evaluation_framework as ef
+import generate_data
 import logging
+import mmap
+import os
 import plot
 import numpy as np
+import threading
+
+try:
+    import queue
+except ImportError:
+    # Python 2
+    import Queue as queue
+
+from multiprocessing.pool import ThreadPool
+
+# Size (in bytes) of the buffer used to read indices and selected features files
+READ_BUFFER_SIZE = 1 << 17
+
+# Algorithms whose outputs are handled, and the keys under which
+# their selected features are stored in fold dictionaries (same order)
+ALGOS = ('sfan', 'msfan_np', 'msfan')
+SELECTED_KEYS = ('selected_st', 'selected_np', 'selected')
+
+
+def get_fold_fnames(resu_dir, simu_id, fold_idx, num_subsamples):
+    """ Give the names of the files holding the indices and selected features of a fold.
+
+    Parameters
+    ----------
+    resu_dir : dir path
+        Path of the directory holding the results of the repeat.
+    simu_id : string
+        Name of the simulation, used to name files.
+    fold_idx : int
+        Index of the fold.
+    num_subsamples : int
+        Number of subsamples.
+
+    Returns
+    -------
+    fnames : list of filenames
+        In order: train indices, test indices, subsample indices
+        (one file per subsample), then selected features of
+        sfan, msfan_np and msfan.
+    """
+    fold_prefix = '%s/%s.fold%d' % (resu_dir, simu_id, fold_idx)
+    fnames = [fold_prefix + '.trIndices', fold_prefix + '.teIndices']
+    fnames.extend('%s.ss%d.ssIndices' % (fold_prefix, ss_idx) \
+                  for ss_idx in range(num_subsamples))
+    fnames.extend('%s/%s.%s.fold_%d.selected_features' % \
+                  (resu_dir, simu_id, algo, fold_idx) \
+                  for algo in ALGOS)
+    return fnames
+
+
+def advise_sequential_read(f):
+    """ Tell the kernel that a file is about to be read entirely, sequentially,
+    so that it prefetches it.
+
+    Does nothing where os.posix_fadvise is not available (Python 2, non-POSIX systems).
+
+    Parameters
+    ----------
+    f : file object
+        File opened for reading.
+    """
+    if hasattr(os, 'posix_fadvise'):
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_WILLNEED)
+
+
+def read_file(fname):
+    """ Read the whole content of a file.
+
+    Parameters
+    ----------
+    fname : filename
+        Path to the file.
+
+    Returns
+    -------
+    content : string
+        Content of the file (undecoded).
+    """
+    with open(fname, 'rb', buffering=READ_BUFFER_SIZE) as f:
+        advise_sequential_read(f)
+        return f.read()
+
+
+def parse_ints(line):
+    """ Parse a line of space-separated integers.
+
+    Parameters
+    ----------
+    line : string
+        Line of space-separated integers (trailing newline allowed).
+
+    Returns
+    -------
+    values : array
+        Integers of the line (int32 array).
+    """
+    # Stripped, as np.fromstring parses a line holding only whitespace as [0]
+    return np.fromstring(line.strip(), dtype=np.int32, sep=' ')
+
+
+def parse_indices(contents):
+    """ Parse the contents of indices files.
+
+    Parameters
+    ----------
+    contents : list of strings
+        Contents of the indices files of a fold, in the order of get_fold_fnames.
+
+    Returns
+    -------
+    fold_indices : dict
+        {
+            'trIndices': train indices (int32 array),
+            'teIndices': test indices (int32 array),
+            'ssIndices': list of subsample indices (int32 arrays)
+        }
+    """
+    # Indices files hold a single line
+    indices = [parse_ints(content.split(b'\n', 1)[0]) for content in contents]
+    return {'trIndices': indices[0], 'teIndices': indices[1],
+            'ssIndices': indices[2:]}
+
+
+def parse_selected_features(lines):
+    """ Parse the lines of a selected features file.
+
+    Parameters
+    ----------
+    lines : iterable of strings
+        Lines of the file: one line (space-separated list of selected features) per task.
+
+    Returns
+    -------
+    selected_features : list of arrays
+        Selected features (int32 array) for each task.
+    """
+    return [parse_ints(line) for line in lines]
+
+
+def load_selected_features(fname):
+    """ Read a selected features file.
+
+    Binary copies (.npy) are loaded as is. Text files are memory-mapped
+    and parsed line by line from the mapping, without copying their whole content.
+
+    Parameters
+    ----------
+    fname : filename
+        Path to the file: one line (space-separated list of selected features) per task,
+        or its binary copy (see ef.save_selected_features).
+
+    Returns
+    -------
+    selected_features : list of arrays
+        Selected features (int32 array) for each task.
+    """
+    if fname.endswith('.npy'):
+        return ef.load_selected_features_npy(fname)
+    with open(fname, 'rb') as f:
+        advise_sequential_read(f)
+        # Empty files cannot be mapped
+        if not os.fstat(f.fileno()).st_size:
+            return []
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return parse_selected_features(iter(mm.readline, b''))
+        finally:
+            mm.close()
+
+
+def list_dir(dir_name):
+    """ List the names of the entries of a directory, in a single pass.
+
+    Parameters
+    ----------
+    dir_name : dir path
+        Path of the directory.
+
+    Returns
+    -------
+    names : set of strings
+        Names (without the directory) of the entries of dir_name.
+    """
+    if not hasattr(os, 'scandir'):
+        # Python 2
+        return set(os.listdir(dir_name))
+    return set(entry.name for entry in os.scandir(dir_name))
+
+
+def check_files_exist(dir_names, fnames):
+    """ Check that files are listed in the entries of their directory.
+
+    Parameters
+    ----------
+    dir_names : set of strings
+        Names of the entries of the directory, as returned by list_dir.
+    fnames : list of filenames
+        Paths of files in this directory.
+
+    Side effects
+    ------------
+    Raise an IOError listing the files that do not exist, if any.
+    """
+    missing_fnames = [fname for fname in fnames \
+                      if os.path.basename(fname) not in dir_names]
+    if missing_fnames:
+        raise IOError("Missing files: %s" % ', '.join(missing_fnames))
+
+
+def load_folds(resu_dir, simu_id, num_folds, num_subsamples, use_cache=False,
+               num_threads=16):
+    """ Read the indices and selected features of all folds of a repeat.
+
+    The indices are read from the archive <resu_dir>/<simu_id>.indices.npz
+    when there are no indices text files, or when it is more recent than them.
+    The other files of all folds are read in a single batch, concurrently,
+    once their existence has been checked on a single listing of resu_dir.
+    Selected features are read from their binary copies (.npy) when they exist
+    and are more recent than the text files.
+
+    Parameters
+    ----------
+    resu_dir : dir path
+        Path of the directory holding the results of the repeat.
+    simu_id : string
+        Name of the simulation, used to name files.
+    num_folds : int
+        Number of folds.
+    num_subsamples : int
+        Number of subsamples.
+    use_cache : boolean, optional
+        If true and the indices are read from text files,
+        save them to <resu_dir>/<simu_id>.indices.npz for the next runs.
+    num_threads : int, optional
+        Maximum number of files read at the same time.
+
+    Returns
+    -------
+    folds : list of dict
+        For each fold, the dictionary returned by parse_indices, plus
+        {
+            'selected_st': selected features (int32 array) for each task (sfan),
+            'selected_np': selected features (int32 array) for each task (msfan_np),
+            'selected': selected features (int32 array) for each task (msfan)
+        }
+
+    Side effects
+    ------------
+    If use_cache is true and the indices are read from text files,
+    create <resu_dir>/<simu_id>.indices.npz.
+    Raise an IOError if some of the files of the folds do not exist.
+    """
+    num_indices_files = 2 + num_subsamples
+    fold_fnames = [get_fold_fnames(resu_dir, simu_id, fold_idx, num_subsamples) \
+                   for fold_idx in range(num_folds)]
+    indices_fnames = [fname for fnames in fold_fnames for fname in fnames[:num_indices_files]]
+    selected_fnames = [fname for fnames in fold_fnames for fname in fnames[num_indices_files:]]
+
+    archive_fname = ef.get_indices_archive_fname(resu_dir, simu_id)
+    resu_files = list_dir(resu_dir)
+    if os.path.basename(indices_fnames[0]) not in resu_files:
+        # Indices only saved to the archive
+        from_archive = True
+        check_files_exist(resu_files, [archive_fname] + selected_fnames)
+    else:
+        # Indices saved to text files (and possibly cached to the archive)
+        check_files_exist(resu_files, indices_fnames + selected_fnames)
+        from_archive = os.path.basename(archive_fname) in resu_files and \
+                       ef.is_cache_valid(archive_fname, indices_fnames)
+    if from_archive:
+        logging.info("Reading indices from %s" % archive_fname)
+
+    # Binary copies of the selected features files, when they are up to date
+    selected_fnames = [ef.get_selected_features_npy_fname(fname) \
+                       if os.path.basename(ef.get_selected_features_npy_fname(fname)) \
+                       in resu_files and \
+                       ef.is_cache_valid(ef.get_selected_features_npy_fname(fname), [fname]) \
+                       else fname \
+                       for fname in selected_fnames]
+
+    # Submit the reads of all files at once
+    pool = ThreadPool(min(len(indices_fnames) + len(selected_fnames), num_threads))
+    indices_result = pool.map_async(read_file, [] if from_archive else indices_fnames)
+    selected_result = pool.map_async(load_selected_features, selected_fnames)
+    contents = indices_result.get()
+    selected_features = selected_result.get()
+    pool.close()
+    pool.join()
+
+    num_selected_files = len(selected_fnames) // num_folds
+    folds = [dict(zip(SELECTED_KEYS,
+                      selected_features[fold_idx*num_selected_files:\
+                                        (fold_idx+1)*num_selected_files])) \
+             for fold_idx in range(num_folds)]
+
+    if from_archive:
+        xp_indices = ef.load_indices_archive(archive_fname, num_folds, num_subsamples)
+    else:
+        xp_indices = [parse_indices(contents[fold_idx*num_indices_files:\
+                                             (fold_idx+1)*num_indices_files]) \
+                      for fold_idx in range(num_folds)]
+        if use_cache:
+            ef.save_indices_archive(archive_fname, xp_indices)
+
+    for fold, fold_indices in zip(folds, xp_indices):
+        fold.update(fold_indices)
+    return folds
+
+
+
+def load_repeats(args, repeats_queue):
+    """ Read the indices and selected features of all folds, repeat after repeat.
+
+    Meant to run in its own thread, so that the files of the next repeats
+    are read while the current one is processed.
+
+    Parameters
+    ----------
+    args : namespace object
+        Arguments of handle-output.py.
+    repeats_queue : Queue object
+        Queue in which the folds of each repeat are put.
+
+    Side effects
+    ------------
+    Put, for each repeat, the list of folds returned by load_folds in repeats_queue.
+    If reading the files of a repeat raises an exception, put it instead and stop.
+    """
+    for repeat_idx in range(args.num_repeats):
+        resu_dir = "%s/repeat_%d" % (args.resu_dir, repeat_idx)
+        try:
+            folds = load_folds(resu_dir, args.simu_id, args.num_folds, args.num_subsamples,
+                               use_cache=args.use_cache)
+        except Exception as e:
+            repeats_queue.put(e)
+            return
+        repeats_queue.put(folds)
 
 
 
@@ -43,7 +385,7 @@ def print_and_save_measure_table(measure_name, data, out_fname):
     to_print = ''
     to_save = ''
 
-    for task_idx in xrange (len (data[algos_names[0]] ) ) : 
+    for task_idx in range (len (data[algos_names[0]] ) ) : 
         to_print += '{:^7d}|'.format(task_idx) 
         to_save += '{:^7d}&'.format(task_idx) 
         for algo in algos_names : 
@@ -55,7 +397,7 @@ def print_and_save_measure_table(measure_name, data, out_fname):
         to_save += "\\\\\n" # two step and not to_save[-1] = "\\\\\n" because python strings are immuable
         to_print+="\n"
         
-    print  header_print  %measure_name + to_print
+    print(header_print  %measure_name + to_print)
 
     with open(out_fname, 'w') as f : 
         f.write(header_save+to_save)
@@ -99,14 +441,14 @@ def extract_plotable_data_from_analysis_files(f_names, num_tasks, num_repeats, n
     # are per fold, then per task, 
     # we have to compute means per task taking account of value per repeat and per fold. 
     for algo_idx, algo in enumerate(algos) : 
-        data_for_an_algo  = [[float() for i in xrange(num_repeats)] for j in xrange(num_tasks)]
+        data_for_an_algo  = [[float() for i in range(num_repeats)] for j in range(num_tasks)]
         with open (f_names[algo_idx], 'r') as f : 
             # for repeat_idx, line in enumerate(f) :
-            for repeat_idx in xrange(num_repeats) : 
+            for repeat_idx in range(num_repeats) : 
                 line = f.readline()
                 line_content = [float (item) for item in line.split()]
                 # line_content contains every float of the line 
-                for task_idx in xrange(num_tasks) :
+                for task_idx in range(num_tasks) :
                     # we get values for the current task in content_for_a_task using a slice : 
                     # - if data are holded one line per repeat, then per task, for each fold, 
                     #   the slice take values stepped by num_tasks until the end of the line
@@ -149,6 +491,10 @@ if __name__ == "__main__":
         Name of the simulation, to be used to name files within args.root_dir.
     args.verbose: boolean
         If true, turn on detailed information logging.
+    args.use_cache: boolean
+        If true, save the indices of each repeat read from text files
+        (as written by previous versions of synthetic_data_experiments.py)
+        to the archive read by the next runs.
 
     Generated files
     ---------------
@@ -216,81 +562,62 @@ if __name__ == "__main__":
 
 
     """
-    args = sde.get_integrous_arguments_values()
-
-    for repeat_idx in xrange(args.num_repeats) : 
-        print '=========== repeat : ', repeat_idx
+    parser = sde.get_arguments_parser()
+    parser.add_argument("-c", "--use_cache", help="Save indices read from text files to " + \
+                        "<resu_dir>/repeat_<repeat_idx>/<simu_id>.indices.npz",
+                        action='store_true')
+    args = parser.parse_args()
+    sde.check_arguments_integrity(args)
+
+    analysis_files = sde.get_analysis_files_names(args.resu_dir, args.simu_id)
+
+    # Read the files of the next repeats while processing the current one
+    # (at most 2 repeats ahead)
+    repeats_queue = queue.Queue(maxsize=2)
+    reader = threading.Thread(target=load_repeats, args=(args, repeats_queue))
+    reader.daemon = True
+    reader.start()
+
+    for repeat_idx in range(args.num_repeats) : 
+        print('=========== repeat : ', repeat_idx)
         resu_dir = "%s/repeat_%d" % (args.resu_dir, repeat_idx)
         data_dir = '%s/repeat_%d' % (args.data_dir, repeat_idx)
         
-
-        analysis_files = sde.get_analysis_files_names(args.resu_dir, args.simu_id)
+        # Templates of the names of the prediction files, for each algorithm
+        # (to be formatted with fold_idx and task_idx)
+        predicted_templates = dict((algo, '%s/%s.%s.fold_%%d.task_%%d.predicted' % \
+                                    (resu_dir, args.simu_id, algo)) \
+                                   for algo in ALGOS)
         #-----------------
         genotype_fname = '%s/%s.genotypes.txt' % (data_dir, args.simu_id)
-        #------------------
-        phenotypes_fnames = ['%s/%s.phenotype_%d.txt' % \
-                        (data_dir, args.simu_id, task_idx) \
-                        for task_idx in range(args.num_tasks)]
+        check_files_exist(list_dir(data_dir), [genotype_fname])
 
         #------------------
-        # get causal features from files
-        causal_fname = '%s/%s.causal_features.txt' % (data_dir, args.simu_id)
-        causal_features = []
-        with open(causal_fname, 'r') as f:
-            for line_idx, line in enumerate(f):
-                causal_features.append( map(int, line.split()) )
+        # get causal features and phenotypes
+        # (from <data_dir>/<simu_id>.bundle.npz, or from text files)
+        causal_features, phenotypes = \
+            generate_data.read_causal_features_and_phenotypes(data_dir, args.simu_id,
+                                                              args.num_tasks)
+        # as a (num_tasks, num_features) membership matrix, shared by all folds
+        causal_features = ef.get_membership_matrix(causal_features, args.num_features)
         #-------------------
         
 
         #-------------------
-        trIndices_fname = resu_dir+'/'+args.simu_id+'.fold%d.trIndices'
-        teIndices_fname = resu_dir+'/'+args.simu_id+'.fold%d.teIndices'
-        ssIndices_fname = resu_dir+'/'+args.simu_id+'.fold%d.ss%d.ssIndices'
-        
-        xp_indices = [{'trIndices': list(), 'teIndices':list(), 'ssIndices':list()} for fold in xrange(args.num_folds)]
+        # Get the files of all folds, as read by the reader thread
+        folds = repeats_queue.get()
+        if isinstance(folds, Exception):
+            raise folds
 
-        for fold_idx in xrange (args.num_folds) : 
-            print 'folds : ', fold_idx
-            #----------------------------------------------------------------------------
-            # get xp_indices from files : 
-            
-            with open(trIndices_fname %(fold_idx), 'r') as trIndices_f : 
-                line = trIndices_f.readline().split()
-                xp_indices[fold_idx]["trIndices"] = [int (i) for i in line ]
-            with open(teIndices_fname %(fold_idx),'r') as teIndices_f : 
-                line = teIndices_f.readline().split()
-                xp_indices[fold_idx]["teIndices"] =  [int (i) for i in line ]
-            
-            for ss_idx in xrange (args.num_subsamples) : 
-                with open(ssIndices_fname  %(fold_idx,ss_idx), 'r') as ssIndices_f:
-                    line = ssIndices_f.readline().split()
-                    xp_indices[fold_idx]["ssIndices"].append( [int (i) for i in line ] ) 
-            #----------------------------------------------------------------------------
-            
-            
-            #-----------------------------------------------------------------------------
-            # Get selected features from files : 
-            
-            selected_st = []
-            fname = '%s/%s.sfan.fold_%d.selected_features' % \
-                (resu_dir, args.simu_id, fold_idx)
-            with open(fname, 'r') as f :
-                for line in f : #list of selected feature for a task
-                    selected_st.append([int(x) for x in line.split()])
-
-            selected_np=[]
-            fname = '%s/%s.msfan_np.fold_%d.selected_features' % \
-                (resu_dir, args.simu_id, fold_idx)
-            with open(fname, 'r') as f :
-                for line in f : #list of selected feature for a task
-                    selected_np.append([int(x) for x in line.split()])
-
-            selected = []
-            fname = '%s/%s.msfan.fold_%d.selected_features' % \
-                (resu_dir, args.simu_id, fold_idx)
-            with open(fname, 'r') as f :
-                for line in f : #list of selected feature for a task
-                    selected.append([int(x) for x in line.split()])
+        xp_indices = [{'trIndices': fold['trIndices'], 'teIndices': fold['teIndices'],
+                       'ssIndices': fold['ssIndices']} for fold in folds]
+
+        for fold_idx in range (args.num_folds) : 
+            print('folds : ', fold_idx)
+            # Selected features, as (num_tasks, num_features) membership matrices
+            selected_st, selected_np, selected = [ef.get_membership_matrix(folds[fold_idx][key],
+                                                                           args.num_features) \
+                                                  for key in SELECTED_KEYS]
 
             #--------------------------------------------------------------------------------
             # Measure computation : 
@@ -305,21 +632,14 @@ if __name__ == "__main__":
             # for each task
             
 
-            # Single task
-            acc_list_st, mcc_list_st, ppv_list_st, tpr_list_st = ef.evaluate_classification(
-                                                            causal_features,
-                                                            selected_st,
-                                                            args.num_features)
-            # Multitask (no precision)
-            acc_list_np, mcc_list_np, ppv_list_np, tpr_list_np = ef.evaluate_classification(
-                                                            causal_features,
-                                                            selected_np,
-                                                            args.num_features)
-            # Multitask (precision)
-            acc_list_msfan, mcc_list_msfan, ppv_list_msfan, tpr_list_msfan = ef.evaluate_classification(
-                                                            causal_features,
-                                                            selected,
-                                                            args.num_features)
+            # Single task, multitask (no precision) and multitask (precision),
+            # evaluated together
+            ((acc_list_st, mcc_list_st, ppv_list_st, tpr_list_st),
+             (acc_list_np, mcc_list_np, ppv_list_np, tpr_list_np),
+             (acc_list_msfan, mcc_list_msfan, ppv_list_msfan, tpr_list_msfan)) = \
+                ef.evaluate_classification_batched(causal_features,
+                                                   [selected_st, selected_np, selected],
+                                                   args.num_features)
 
             #--------------------------------------------------------------------------------
             # Measure saving in <measure>_fname
@@ -363,32 +683,16 @@ if __name__ == "__main__":
             # predict on the test set using a ridge-
             # regression trained with the selected features only.
 
-            for task_idx in xrange(args.num_tasks):
-                print 'task', task_idx
+            for task_idx in range(args.num_tasks):
+                print('task', task_idx)
                 logging.info ('task n. %d' %task_idx)
-                # Single task
-                logging.info("prediction st")
-                fname = '%s/%s.sfan.fold_%d.task_%d.predicted' % \
-                        (resu_dir, args.simu_id, fold_idx, task_idx)
-                ef.run_ridge_selected(selected_st[task_idx], genotype_fname,
-                                      phenotypes_fnames[task_idx],
-                                      xp_indices[fold_idx]['trIndices'], xp_indices[fold_idx]['teIndices'], fname)
-
-                # Multitask (no precision)
-                logging.info("pred np")
-                fname = '%s/%s.msfan_np.fold_%d.task_%d.predicted' % \
-                        (resu_dir, args.simu_id, fold_idx, task_idx)
-                ef.run_ridge_selected(selected_np[task_idx], genotype_fname,
-                                      phenotypes_fnames[task_idx],
-                                      xp_indices[fold_idx]['trIndices'], xp_indices[fold_idx]['teIndices'], fname)
-
-                # Multitask (precision)
-                logging.info("pred msfan")
-                fname = '%s/%s.msfan.fold_%d.task_%d.predicted' % \
-                        (resu_dir, args.simu_id, fold_idx, task_idx)
-                ef.run_ridge_selected(selected[task_idx], genotype_fname,
-                                      phenotypes_fnames[task_idx],
-                                      xp_indices[fold_idx]['trIndices'], xp_indices[fold_idx]['teIndices'], fname)
+                # Single task, multitask (no precision), multitask (precision)
+                for algo, key in zip(ALGOS, SELECTED_KEYS):
+                    logging.info("prediction %s" % algo)
+                    fname = predicted_templates[algo] % (fold_idx, task_idx)
+                    ef.run_ridge_selected(folds[fold_idx][key][task_idx], genotype_fname,
+                                          phenotypes[task_idx],
+                                          xp_indices[fold_idx]['trIndices'], xp_indices[fold_idx]['teIndices'], fname)
 
         # END for fold_idx in range(args.num_folds)
         
@@ -398,7 +702,7 @@ if __name__ == "__main__":
         # using :
         #   - an external function : compute_ridge_selected_RMSE() returns list of rmse, task per task
         #   - the predictions saved in files (fold per fold)
-        #   - the true values given by phenotypes_fnames[task_idx] and te_indices
+        #   - the true values given by phenotypes[task_idx] and te_indices
         # save to file '%s/%s.<algo>.rmse' % (args.resu_dir, args.simu_id)
         # => rmse_st_fname ; rmse_np_fname ; rmse_fname
         # Files structure : 
@@ -406,26 +710,26 @@ if __name__ == "__main__":
         # on each line there are several RMSE values, one per task
 
         # Single task
-        predicted_phenotypes_fname = resu_dir+'/'+args.simu_id+'.sfan.fold_%d.task_%d.predicted' 
-        print predicted_phenotypes_fname
-        print xp_indices
-        rmse_list = ef.compute_ridge_selected_RMSE( phenotypes_fnames, predicted_phenotypes_fname, 
+        predicted_phenotypes_fname = predicted_templates['sfan']
+        print(predicted_phenotypes_fname)
+        print(xp_indices)
+        rmse_list = ef.compute_ridge_selected_RMSE( phenotypes, predicted_phenotypes_fname, 
                                         xp_indices)
-        print rmse_list
+        print(rmse_list)
         with open(analysis_files['rmse_st'], 'a') as f:
             f.write('%s \n' % ' '.join(['%.2f ' % x for x in rmse_list]))
         # Multitask (no precision)
-        predicted_phenotypes_fname = resu_dir+'/'+args.simu_id+'.msfan_np.fold_%d.task_%d.predicted' 
-        rmse_list = ef.compute_ridge_selected_RMSE( phenotypes_fnames, predicted_phenotypes_fname, 
+        predicted_phenotypes_fname = predicted_templates['msfan_np']
+        rmse_list = ef.compute_ridge_selected_RMSE( phenotypes, predicted_phenotypes_fname, 
                                         xp_indices)
-        print rmse_list
+        print(rmse_list)
         with open(analysis_files['rmse_msfan_np'], 'a') as f:
             f.write('%s \n' % ' '.join(['%.2f ' % x for x in rmse_list]))
         # Multitask (precision)
-        predicted_phenotypes_fname = resu_dir+'/'+args.simu_id+'.msfan.fold_%d.task_%d.predicted' 
-        rmse_list = ef.compute_ridge_selected_RMSE( phenotypes_fnames, predicted_phenotypes_fname, 
+        predicted_phenotypes_fname = predicted_templates['msfan']
+        rmse_list = ef.compute_ridge_selected_RMSE( phenotypes, predicted_phenotypes_fname, 
                                         xp_indices)       
-        print rmse_list      
+        print(rmse_list)
         with open(analysis_files['rmse_msfan'], 'a') as f:
             f.write('%s \n' % ' '.join(['%.2f ' % x for x in rmse_list]))
         #----------------------------------------------------------------------
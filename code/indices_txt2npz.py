@@ -0,0 +1,52 @@
+# indices_txt2npz.py -- Convert the cross-validation indices text files of each repeat
+# into a single .npz archive per repeat
+
+
+from __future__ import print_function
+
+import argparse
+import os
+
+import evaluation_framework as ef
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert .trIndices, .teIndices and ' + \
+                                     '.ssIndices files to <simu_id>.indices.npz archives')
+    parser.add_argument("-r", "--num_repeats", help="Number of repeats", type=int,
+                        required=True)
+    parser.add_argument("-f", "--num_folds", help="Number of CV folds", type=int,
+                        required=True)
+    parser.add_argument("-s", "--num_subsamples", help="Number of subsamples", type=int,
+                        required=True)
+    parser.add_argument("resu_dir", help="Results directory")
+    parser.add_argument("simu_id", help="Simulation name")
+    parser.add_argument("--remove", help="Remove the text files once converted",
+                        action='store_true')
+    args = parser.parse_args()
+
+    for repeat_idx in range(args.num_repeats):
+        resu_dir = '%s/repeat_%d' % (args.resu_dir, repeat_idx)
+        if not os.path.isfile('%s/%s.fold0.trIndices' % (resu_dir, args.simu_id)):
+            print('%s: no indices text files, skipped' % resu_dir)
+            continue
+
+        # remove any previous archive, as read_indices reads it first
+        archive_fname = ef.get_indices_archive_fname(resu_dir, args.simu_id)
+        if os.path.isfile(archive_fname):
+            os.remove(archive_fname)
+
+        # read the text files and save them to the archive
+        xp_indices = ef.read_indices(resu_dir, args.simu_id, args.num_folds,
+                                     args.num_subsamples)
+        ef.save_indices_archive(archive_fname, xp_indices)
+
+        if args.remove:
+            for fold_idx in range(args.num_folds):
+                fold_prefix = '%s/%s.fold%d' % (resu_dir, args.simu_id, fold_idx)
+                os.remove(fold_prefix + '.trIndices')
+                os.remove(fold_prefix + '.teIndices')
+                for ss_idx in range(args.num_subsamples):
+                    os.remove('%s.ss%d.ssIndices' % (fold_prefix, ss_idx))
+
+if __name__ == "__main__":
+    main()
@@ -111,12 +111,22 @@ References
     In Proceedings of the 2014 SIAM International Conference on Data Mining, pp. 19--207.
 """
 
+from __future__ import division, print_function
+
 import argparse
 import doctest
 import logging
 import numpy as np
+import os
 import sys
-import time
+
+try:
+    from time import process_time
+except ImportError:
+    # Python 2
+    from time import clock as process_time
+
+from scipy.linalg import cho_factor, cho_solve
 
 import gt_maxflow
 
@@ -145,6 +155,87 @@ def get_network(network_arg, task_idx):
         return network_arg[task_idx]
 
 
+class NetworkCache(object):
+    """ Cache of parsed network files.
+
+    Each network is parsed only once, and kept as long as its file
+    is not modified, so that solving several problems over the same network
+    within a process does not re-parse it each time.
+
+    Attributes
+    ----------
+    networks: dictionary
+        networks[path] = (modification time, num_nodes, num_edges, arcs)
+        where arcs is the list of (node, neighbour, weight) arcs of the network,
+        in the order of the network file.
+    """
+    def __init__(self):
+        self.networks = {}
+
+
+    def get(self, network_f):
+        """ Get a parsed network.
+
+        Parameters
+        ----------
+        network_f: filename
+            Path to the network file (dimacs format).
+
+        Returns
+        -------
+        num_nodes: int
+            Number of nodes of the network.
+        num_edges: int
+            Number of edges of the network.
+        arcs: list of (int, int, float) tuples
+            Arcs of the network, as (node, neighbour, weight).
+            Must not be modified.
+        """
+        mtime = os.stat(network_f).st_mtime
+        if network_f not in self.networks or \
+           self.networks[network_f][0] != mtime:
+            self.networks[network_f] = (mtime, ) + parse_network(network_f)
+        return self.networks[network_f][1:]
+
+
+def parse_network(network_f):
+    """ Parse a network file.
+
+    Parameters
+    ----------
+    network_f: filename
+        Path to the network file (dimacs format).
+
+    Returns
+    -------
+    num_nodes: int
+        Number of nodes of the network.
+    num_edges: int
+        Number of edges of the network.
+    arcs: list of (int, int, float) tuples
+        Arcs of the network, as (node, neighbour, weight),
+        from the first arc line to the next empty line.
+    """
+    with open(network_f, 'r') as f:
+        ls = f.readline().split()
+        num_nodes = int(ls[2])
+        num_edges = int(ls[3])
+
+        arcs = []
+        for line in f:
+            ls = line.split()
+            if not ls:
+                if arcs:
+                    break
+            elif ls[0] == "a" or arcs:
+                arcs.append((int(ls[1]), int(ls[2]), float(ls[3])))
+    return num_nodes, num_edges, arcs
+
+
+# Networks parsed within this process
+default_network_cache = NetworkCache()
+
+
 
 def sort_hyperparameters(hyperparams):
     """ Sort a list of hyperparameters.
@@ -169,34 +260,43 @@ def sort_hyperparameters(hyperparams):
         l = float(h.split()[1])
         e = float(h.split()[3])
         m = float(h.split()[5])
-        if not hyperparams_d.has_key(l):
+        if l not in hyperparams_d:
             hyperparams_d[l] = {e:{m:h}}
         else:
             hl = hyperparams_d[l]
-            if not hl.has_key(e):
+            if e not in hl:
                 hyperparams_d[l][e] = {m:h}
             else:
                 he = hyperparams_d[l][e]
                 hyperparams_d[l][e][m] = h
     hyperparams_sorted = []
-    l_sorted = hyperparams_d.keys()
+    l_sorted = list(hyperparams_d.keys())
     l_sorted.sort()
     for l in l_sorted:
         hl = hyperparams_d[l]
-        e_sorted = hl.keys()
+        e_sorted = list(hl.keys())
         e_sorted.sort()
         for e in e_sorted:
             he = hl[e]
-            m_sorted = he.keys()
+            m_sorted = list(he.keys())
             m_sorted.sort()
             for m in m_sorted:
                 hyperparams_sorted.append(he[m])
     return hyperparams_sorted
 
 
+class SfanError(Exception):
+    """ Error raised by Sfan when a problem cannot be solved
+    (inconsistent networks or task covariance/precision matrices, ...).
+    """
+    pass
+
+
 class Sfan(object):
     """ Solve a multi-task network-guided feature selection problem.
 
+    Errors in the problem definition raise a SfanError.
+
     Attributes
     ----------
     num_tasks: int
@@ -237,9 +337,12 @@ class Sfan(object):
 
     output_f: {filename, None}, optional
         File where to store computation run times.        
+    network_cache: NetworkCache
+        Cache from which the networks are read.
     """
     def __init__(self, num_tasks, networks_f, node_weights_f, lbd, eta, mu=None,
-                 covariance_matrix_f=None, precision_matrix_f=None, output_f=None):
+                 covariance_matrix_f=None, precision_matrix_f=None, output_f=None,
+                 network_cache=None):
         """
         Parameters
         ----------
@@ -265,6 +368,9 @@ class Sfan(object):
             Path to precision matrix.
         output_f: {filename, None}, optional
             File where to store computation run times.        
+        network_cache: {NetworkCache, None}, optional
+            Cache from which to read the networks.
+            Defaults to a cache shared within the process.
         """
         self.num_tasks = num_tasks
         self.networks_f = networks_f
@@ -273,28 +379,27 @@ class Sfan(object):
         self.eta = eta
         self.mu = mu
         self.output_f = output_f
+        if network_cache is None:
+            network_cache = default_network_cache
+        self.network_cache = network_cache
         
         # Read networks nodes count and edges count
         self.super_num_nodes = 0
         self.num_nodes_each_network = 0
         self.super_num_edges = 0
         for task_idx in range(num_tasks):
-            with open(get_network(networks_f, task_idx), 'r') as f:
-                ls = f.readline().split()
+            num_nodes, num_edges, arcs = \
+                self.network_cache.get(get_network(networks_f, task_idx))
 
-                if not self.num_nodes_each_network:
-                    self.num_nodes_each_network = int(ls[2])
+            if not self.num_nodes_each_network:
+                self.num_nodes_each_network = num_nodes
 
-                elif (self.num_nodes_each_network != int(ls[2])) :
-                    f.close
-                    logging.error("All networks must have the same number of" + \
-                                     " nodes.\n")
-                    sys.exit(-1)
+            elif (self.num_nodes_each_network != num_nodes) :
+                raise SfanError("All networks must have the same number of" + \
+                                " nodes.")
 
-                self.super_num_nodes += int(ls[2])
-                self.super_num_edges += int(ls[3])
-
-                f.close()
+            self.super_num_nodes += num_nodes
+            self.super_num_edges += num_edges
 
         # The super network has one node for each node in the task networks,
         # + source and sink
@@ -324,16 +429,22 @@ class Sfan(object):
                         f.close()
                     omega_omegainv = np.dot(self.covariance_matrix, self.precision_matrix)
                     if len(np.where(np.abs(omega_omegainv - np.eye(self.num_tasks)) > 1e-5)[0]):
-                        logging.error("The precision and covariance matrices are incompatible.\n" + \
-                                      "Their product should be the identity matrix.\n")
-                        sys.exit(-1)
+                        raise SfanError("The precision and covariance matrices are incompatible.\n" + \
+                                        "Their product should be the identity matrix.")
                 else:
                     # Compute the precision matrix
+                    # from the Cholesky factorization of the covariance matrix
                     try:
-                        self.precision_matrix = np.linalg.inv(self.covariance_matrix)
-                    except LinAlgError:
-                        logging.error("The covariance matrix should be invertible.\n")
-                        sys.exit(-1)
+                        self.precision_matrix = cho_solve(cho_factor(self.covariance_matrix,
+                                                                     lower=True),
+                                                          np.eye(self.num_tasks))
+                    except np.linalg.LinAlgError:
+                        # Not positive definite (e.g. rounded when saved to text):
+                        # invert it directly
+                        try:
+                            self.precision_matrix = np.linalg.inv(self.covariance_matrix)
+                        except np.linalg.LinAlgError:
+                            raise SfanError("The covariance matrix should be invertible.")
             elif precision_matrix_f:
                 # Use the precision matrix provided
                 with open(precision_matrix_f, 'r') as f:
@@ -440,10 +551,10 @@ class Sfan(object):
             llmax = np.log10(amax / Wmin)
             llmin = np.log10(amin / Wmax)              
             llmed = np.log10(amed / Wmax)
-            lbd_values = [10**(llmed - float(idx)/float((num_values+1)/2) * \
-                                   (llmed-llmin)) for idx in range((num_values+1)/2, 0, -1)]
-            lbd_values.extend([10**(llmed + float(idx)/float(num_values/2) * \
-                                   (llmax-llmed)) for idx in range(num_values/2)])
+            lbd_values = [10**(llmed - float(idx)/float((num_values+1)//2) * \
+                                   (llmed-llmin)) for idx in range((num_values+1)//2, 0, -1)]
+            lbd_values.extend([10**(llmed + float(idx)/float(num_values//2) * \
+                                   (llmax-llmed)) for idx in range(num_values//2)])
 
             lbd_values = ['%.2e' % lbd for lbd in lbd_values]
             #print "\t lbd ", lbd_values
@@ -452,10 +563,10 @@ class Sfan(object):
             lmmax = np.log10(amax)
             lmmin = np.log10(amin)
             lmmed = np.log10(amed)
-            mu_values = [10**(lmmed - float(idx)/float((num_values+1)/2) * \
-                                   (lmmed-lmmin)) for idx in range((num_values+1)/2, 0, -1)]
-            mu_values.extend([10**(lmmed + float(idx)/float(num_values/2) * \
-                                   (lmmax-lmmed)) for idx in range(num_values/2)])
+            mu_values = [10**(lmmed - float(idx)/float((num_values+1)//2) * \
+                                   (lmmed-lmmin)) for idx in range((num_values+1)//2, 0, -1)]
+            mu_values.extend([10**(lmmed + float(idx)/float(num_values//2) * \
+                                   (lmmax-lmmed)) for idx in range(num_values//2)])
 
             mu_values = ['%.2e' % mu for mu in mu_values]
             #print "\t mu  ", mu_values
@@ -464,7 +575,7 @@ class Sfan(object):
 
 
         hyperparams = []
-        for eta, [lbd_values, mu_values] in params_dict.iteritems():
+        for eta, [lbd_values, mu_values] in params_dict.items():
             for lbd, mu in zip(lbd_values, mu_values):
                 hyperparams.append('-l %s -e %s -m %s' % (lbd, eta, mu))
         
@@ -530,8 +641,8 @@ class Sfan(object):
                         amax = max(amax, np.max(avec))
                         amin = min(amin, np.min(avec))
                         if amin < 1e-10:
-                            logging.error("!amin too small! amin = %f mu = %f eta = %f\n", amin, mu, eta)
-                            sys.exit(-1)
+                            raise SfanError("!amin too small! amin = %f mu = %f eta = %f" % \
+                                            (amin, mu, eta))
                         amed = np.median(avec)
                         f.close()
 
@@ -552,18 +663,18 @@ class Sfan(object):
                 llmax = np.log10(amax / Wmin)
                 llmin = np.log10(amin / Wmax)              
                 llmed = np.log10(amed / Wmax)
-                lbd_values = [10**(llmed - float(idx)/float((num_values+1)/2) * \
-                                       (llmed-llmin)) for idx in range((num_values+1)/2, 0, -1)]
-                lbd_values.extend([10**(llmed + float(idx)/float(num_values/2) * \
-                                       (llmax-llmed)) for idx in range(num_values/2)])
+                lbd_values = [10**(llmed - float(idx)/float((num_values+1)//2) * \
+                                       (llmed-llmin)) for idx in range((num_values+1)//2, 0, -1)]
+                lbd_values.extend([10**(llmed + float(idx)/float(num_values//2) * \
+                                       (llmax-llmed)) for idx in range(num_values//2)])
 
                 lbd_values = ['%.2e' % lbd for lbd in lbd_values]
                 logging.info("\t\t %s" % " ".join(lbd_values))
                 params_dict['%.2e' % mu]['%.2e' % eta] = lbd_values
 
         hyperparams = ['-l %s -e %s -m %s' % (lbd, eta, mu) \
-                       for mu, eta_dict in params_dict.iteritems() \
-                       for eta, lbd_values in eta_dict.iteritems() \
+                       for mu, eta_dict in params_dict.items() \
+                       for eta, lbd_values in eta_dict.items() \
                        for lbd in lbd_values]
 
         return sort_hyperparameters(hyperparams)
@@ -595,75 +706,72 @@ class Sfan(object):
         a = 0.0
 
         for current_task in range(self.num_tasks):
-            with open(get_network(self.networks_f, current_task), 'r') as f_nt:
-                with open(self.node_weights_f[current_task], 'r') as f_nw:
-                    ls = f_nt.readline().split()
-                    while ls[0] != "a":
-                        ls = f_nt.readline().split()
-                        
-                    for node_idx in range(self.num_nodes_each_network):
-                        try:
-                            current_node = ((self.num_nodes_each_network * current_task) \
-                                            + int(ls[1]))
-                            neighbour_node = ((self.num_nodes_each_network * current_task) \
-                                              + int(ls[2]))
-                            # Connect nodes within the same task
-                            while int(ls[1]) == node_idx + 1:
-                                self.dimacs_graph += ("a %d %d %f\n" % \
-                                                      (current_node, neighbour_node,
-                                                       (float(ls[3])) * self.lbd))
-                                ls = f_nt.readline().split()
-                                if len(ls) == 0:
-                                    break
-                                neighbour_node = ((self.num_nodes_each_network * \
-                                                   current_task) + int(ls[2]))
-
-                        except IndexError:
-                            # Some nodes (with indices greater than the last one in networks_f)
-                            # are disconnected from the rest of the network.
-                            current_node = ((self.num_nodes_each_network * current_task) \
-                                            + int(node_idx) + 1)
-
-                        # Connect corresponding nodes across tasks
-                        if self.num_tasks > 1:
-                            target_node = current_node
-                            while target_node > self.num_nodes_each_network:
-                                target_node -= self.num_nodes_each_network
-
-                            for task_idx in range(self.num_tasks):
-                                real_target_node = self.num_nodes_each_network * \
-                                                   task_idx + target_node
-
-                                if real_target_node != current_node:
-                                    if self.mu:
-                                        omega_k = - self.precision_matrix[current_task]
-                                    else:
-                                        omega_k = np.zeros((self.num_tasks, ))
-                                    
-                                    self.dimacs_graph += ("a %d %d %f\n" % \
-                                                     (current_node, real_target_node,
-                                                      self.mu * omega_k[task_idx]))
-
-                        # Connect nodes to the source and sink nodes
-                        if self.num_tasks > 1 and self.mu > 0:
-                            a = (float(f_nw.readline())) - \
-                                self.mu * self.phi[current_task] - self.eta
-                        else:
-                            a = (float(f_nw.readline())) - self.eta
-
-                        if a >= 0.0:
-                            source_node_data.append("a %d %d %f\n" % \
-                                                    (self.super_num_nodes-1,
-                                                     current_node, a)) 
-                        else:
+            arcs = self.network_cache.get(get_network(self.networks_f, current_task))[2]
+            num_arcs = len(arcs)
+            arc_idx = 0
+            with open(self.node_weights_f[current_task], 'r') as f_nw:
+                for node_idx in range(self.num_nodes_each_network):
+                    if arc_idx < num_arcs:
+                        node, neighbour, weight = arcs[arc_idx]
+                        current_node = ((self.num_nodes_each_network * current_task) \
+                                        + node)
+                        # Connect nodes within the same task
+                        while node == node_idx + 1:
                             self.dimacs_graph += ("a %d %d %f\n" % \
                                                   (current_node,
-                                                   self.super_num_nodes, -a))
-                                                   
-                    f_nw.close()
-                f_nt.close()
-
-            time_task_computations.append(time.clock())
+                                                   (self.num_nodes_each_network * \
+                                                    current_task) + neighbour,
+                                                   weight * self.lbd))
+                            arc_idx += 1
+                            if arc_idx == num_arcs:
+                                break
+                            node, neighbour, weight = arcs[arc_idx]
+
+                    else:
+                        # Some nodes (with indices greater than the last one in networks_f)
+                        # are disconnected from the rest of the network.
+                        current_node = ((self.num_nodes_each_network * current_task) \
+                                        + int(node_idx) + 1)
+
+                    # Connect corresponding nodes across tasks
+                    if self.num_tasks > 1:
+                        target_node = current_node
+                        while target_node > self.num_nodes_each_network:
+                            target_node -= self.num_nodes_each_network
+
+                        for task_idx in range(self.num_tasks):
+                            real_target_node = self.num_nodes_each_network * \
+                                               task_idx + target_node
+
+                            if real_target_node != current_node:
+                                if self.mu:
+                                    omega_k = - self.precision_matrix[current_task]
+                                else:
+                                    omega_k = np.zeros((self.num_tasks, ))
+                                
+                                self.dimacs_graph += ("a %d %d %f\n" % \
+                                                 (current_node, real_target_node,
+                                                  self.mu * omega_k[task_idx]))
+
+                    # Connect nodes to the source and sink nodes
+                    if self.num_tasks > 1 and self.mu > 0:
+                        a = (float(f_nw.readline())) - \
+                            self.mu * self.phi[current_task] - self.eta
+                    else:
+                        a = (float(f_nw.readline())) - self.eta
+
+                    if a >= 0.0:
+                        source_node_data.append("a %d %d %f\n" % \
+                                                (self.super_num_nodes-1,
+                                                 current_node, a)) 
+                    else:
+                        self.dimacs_graph += ("a %d %d %f\n" % \
+                                              (current_node,
+                                               self.super_num_nodes, -a))
+                                               
+                f_nw.close()
+
+            time_task_computations.append(process_time())
 
         for x in source_node_data:
             self.dimacs_graph += x
@@ -679,7 +787,57 @@ class Sfan(object):
         Prints to screen the list of nodes selected in each network. 
         """
         # Pass super network to gt_maxflow
-        gt_maxflow.python_entry_point(self.dimacs_graph, self.num_nodes_each_network)
+        gt_maxflow.python_entry_point(self.dimacs_graph.encode('ascii'),
+                                      self.num_nodes_each_network)
+
+
+def format_runtimes(time_post_setout_process, time_task_computations,
+                    time_all_tasks_computations, time_gt_maxflow, time_total_time):
+    """ Process the runtimes of a run of Sfan into a printable string.
+
+    Parameters
+    ----------
+    time_post_setout_process: float
+        Time stamp of the end of preprocessing (instantiation of Sfan).
+    time_task_computations: list
+        Time stamps of the end of the computations for each task,
+        as returned by Sfan.create_dimacs.
+    time_all_tasks_computations: float
+        Time stamp of the end of the generation of the super-network.
+    time_gt_maxflow: float
+        Time stamp of the end of the optimization.
+    time_total_time: float
+        Total process time.
+
+    Returns
+    -------
+    runtime_str: string
+        Runtimes, one per line. The last line holds the total process time.
+    """
+    runtime_str = ""
+    real_time_task_computations = [0 for x in time_task_computations]
+
+    for (i, x) in enumerate(time_task_computations):
+        if i > 0:
+            real_time_task_computations[i] = x - time_task_computations[i - 1]
+            runtime_str += "Task ({0}) computation time: {1}\n".\
+                           format(i + 1, x - time_task_computations[i - 1])
+            
+        else:
+            real_time_task_computations[i] = x - time_post_setout_process
+            runtime_str += "Task ({0}) computation time: {1}\n".\
+                           format(1, x - time_post_setout_process)
+
+    runtime_str += "Task average computation time: {0}\n".\
+                   format(np.mean(np.array(real_time_task_computations)))
+    runtime_str += "Standard deviation computation time: {0}\n".\
+                      format(np.std(np.array(real_time_task_computations)))
+    runtime_str += "Network building time: {0}\n".\
+                      format(time_all_tasks_computations - time_post_setout_process)
+    runtime_str += "gt_maxflow computation time: {0}\n".\
+                      format(time_gt_maxflow - time_all_tasks_computations)
+    runtime_str += "Process time: {0}\n".format(time_total_time)
+    return runtime_str
 
 
 def main() : 
@@ -813,59 +971,43 @@ def main() :
             sys.exit(-1)
 
     # Time stamp: beginning of computations
-    time_start = time.clock()
+    time_start = process_time()
 
     # Instantiate a sfan solver
-    sfan_solver = Sfan(args.num_tasks, args.networks, args.node_weights,
-                       args.lbd, args.eta,
-                       mu=args.mu, covariance_matrix_f=args.covariance_matrix,
-                       precision_matrix_f=args.precision_matrix,
-                       output_f=args.output)
+    try:
+        sfan_solver = Sfan(args.num_tasks, args.networks, args.node_weights,
+                           args.lbd, args.eta,
+                           mu=args.mu, covariance_matrix_f=args.covariance_matrix,
+                           precision_matrix_f=args.precision_matrix,
+                           output_f=args.output)
+    except SfanError as e:
+        logging.error("%s\n" % e)
+        sys.exit(-1)
 
     # Time stamp: end of preprocessing
-    time_post_setout_process = time.clock()
+    time_post_setout_process = process_time()
         
     # Generate super-network in dimacs format
     time_task_computations = sfan_solver.create_dimacs()
 
     # Time stamp: end of generation of the super-network
-    time_all_tasks_computations = time.clock()
+    time_all_tasks_computations = process_time()
         
-    print "# lambda " + str(args.lbd)
-    print "# eta " + str(args.eta)
+    print("# lambda " + str(args.lbd))
+    print("# eta " + str(args.eta))
     if args.mu:
-        print "# mu " + str(args.mu)
+        print("# mu " + str(args.mu))
 
     # Solve optimization problem (run maxflow)
     sfan_solver.run_maxflow()
 
     # Time stamp: end of optimization
-    time_total_time = time_gt_maxflow = time.clock()
+    time_total_time = time_gt_maxflow = process_time()
     
     # Process runtimes into a printable string
-    runtime_str = ""
-    real_time_task_computations = [0 for x in time_task_computations]
-
-    for (i, x) in enumerate(time_task_computations):
-        if i > 0:
-            real_time_task_computations[i] = x - time_task_computations[i - 1]
-            runtime_str += "Task ({0}) computation time: {1}\n".\
-                           format(i + 1, x - time_task_computations[i - 1])
-            
-        else:
-            real_time_task_computations[i] = x - time_post_setout_process
-            runtime_str += "Task ({0}) computation time: {1}\n".\
-                           format(1, x - time_post_setout_process)
-
-    runtime_str += "Task average computation time: {0}\n".\
-                   format(np.mean(np.array(real_time_task_computations)))
-    runtime_str += "Standard deviation computation time: {0}\n".\
-                      format(np.std(np.array(real_time_task_computations)))
-    runtime_str += "Network building time: {0}\n".\
-                      format(time_all_tasks_computations - time_post_setout_process)
-    runtime_str += "gt_maxflow computation time: {0}\n".\
-                      format(time_gt_maxflow - time_all_tasks_computations)
-    runtime_str += "Process time: {0}\n".format(time_total_time)
+    runtime_str = format_runtimes(time_post_setout_process, time_task_computations,
+                                  time_all_tasks_computations, time_gt_maxflow,
+                                  time_total_time)
 
 
     # Save runtime_str to file (if provided), otherwise print to screen
@@ -1,3 +1,5 @@
+from __future__ import division, print_function
+
 import matplotlib.pyplot as plt
 plt.ioff() #turn interactive mode off -> need to use plt.show() to make the plot appear
 
@@ -38,7 +40,7 @@ def gene_random_fake_data (num_tasks) :
     for key in algos_names : 
         data[key] = []
     n = 5 # Influence num_samples -----------------------------------v
-    for task_id in xrange(num_tasks) :
+    for task_id in range(num_tasks) :
         upper = random.randint(0, 1000)  
         data[algos_names[0]].append(np.random.uniform(0, upper, size=n))
         data[algos_names[1]].append(np.random.uniform(0, upper, size=n-1))
@@ -67,7 +69,7 @@ def gene_fake_data (num_tasks) :
     data = {}
     for key in algos_names : 
         data[key] = []
-    for task_id in xrange (num_tasks) : 
+    for task_id in range (num_tasks) : 
         data[algos_names[0]].append([9, 10, 11])
         data[algos_names[1]].append([4, 5, 6])
         data[algos_names[2]].append([-1,0, 1])
@@ -126,10 +128,10 @@ def vertical_boxplots(data, name) :
 
     fig, axes = plt.subplots(ncols=num_tasks, sharey=True)
     fig.subplots_adjust(wspace=0)
-    fig.canvas.set_window_title(name)
+    fig.canvas.manager.set_window_title(name)
 
-    for i, (ax, task_id) in enumerate( zip(axes, xrange(num_tasks) )) : 
-        print task_id
+    for i, (ax, task_id) in enumerate( zip(axes, range(num_tasks) )) : 
+        print(task_id)
         # plot task per task : 
         boxp = ax.boxplot([data[algo_id][task_id] for algo_id in algos_names], vert = True)
         # add vertical x ticks : 
@@ -144,7 +146,7 @@ def vertical_boxplots(data, name) :
         # set grid : 
         add_hlines(ax) 
 
-    axes[num_tasks / 2 -1].set_title(name)
+    axes[num_tasks // 2 -1].set_title(name)
     #axes[num_tasks / 2].set_xlabel('Task')
     axes[0].set_ylabel('Measure')
 
@@ -176,10 +178,10 @@ def horizontal_boxplots(data,name) :
 
     fig, axes = plt.subplots(num_tasks, 1, sharex=True)
     fig.subplots_adjust(wspace=0, hspace=0)
-    fig.canvas.set_window_title(name)
+    fig.canvas.manager.set_window_title(name)
     
-    for i, (ax, task_id) in enumerate( zip(axes, xrange(num_tasks) )) : 
-        print task_id
+    for i, (ax, task_id) in enumerate( zip(axes, range(num_tasks) )) : 
+        print(task_id)
         # plot task per task : 
         boxp = ax.boxplot([data[algo_id][task_id] for algo_id in algos_names], vert = False)
         # left x labels  = algos names  
@@ -199,7 +201,7 @@ def horizontal_boxplots(data,name) :
 
     axes[0].set_title(name)
     #axes[num_tasks / 2].set_xlabel('Task')
-    axes[num_tasks / 2 -1].set_ylabel('Measure')
+    axes[num_tasks // 2 -1].set_ylabel('Measure')
 
     #make_lined_legend()
     #make_filled_legend() 
@@ -227,12 +229,12 @@ def vertical_barplots(data, name) :
 
     fig, axes = plt.subplots(ncols=num_tasks, sharey=True)
     fig.subplots_adjust(wspace=0)
-    fig.canvas.set_window_title(name)
+    fig.canvas.manager.set_window_title(name)
 
     x_loc = np.arange( len(algos_names) ) # [0, 1, 2] # 3 algos
     bar_width = 0.35
 
-    for i, (ax, task_id) in enumerate( zip(axes, xrange(num_tasks) )) : 
+    for i, (ax, task_id) in enumerate( zip(axes, range(num_tasks) )) : 
         ax.bar(x_loc, [np.mean(data[algo_id][task_id]) for algo_id in algos_names], bar_width )
         ax.set_xticks(x_loc)
         ax.set(xticklabels=algos_names, xlabel=task_id)
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 """synthetic_data_experiments.py -- Run validation experiments on synthetic data
 
-In this version all experiments are run sequentially.
+In this version the repeats are run in parallel, in separate processes,
+and the folds of each repeat sequentially.
 """
+from __future__ import division, print_function
 
 DEBUG_MODE = False
 TIME_EXP = False
@@ -25,7 +27,10 @@ import generate_data
 import plot
 
 import argparse
+import functools
 import logging
+import multiprocessing
+import multiprocessing.pool
 import os
 import numpy as np
 import scipy.stats as st
@@ -38,16 +43,13 @@ import shlex
 import glob
 import random
 
-def get_arguments_values(): 
-    """ Use argparse module to get arguments values.
+def get_arguments_parser(): 
+    """ Build the argparse parser of the arguments shared by the experiment scripts.
 
     Return
     ------
-    args : Namespace object
-        Namespace object populated with arguments converted from strings to objects 
-        and assigned as attributes of the namespace object.
-        They store arguments values (str or int, according to the specifications in
-        the code)
+    parser : ArgumentParser object
+        Parser of the command line arguments.
     """
     help_str = "Validation experiments on synthetic data"
     parser = argparse.ArgumentParser(description=help_str,add_help=True)
@@ -67,6 +69,23 @@ def get_arguments_values():
     parser.add_argument("simu_id", help="Simulation name")
     parser.add_argument("-v", "--verbose", help="Turn on detailed info log",
                         action='store_true')
+    return parser
+
+def get_arguments_values(): 
+    """ Use argparse module to get arguments values.
+
+    Return
+    ------
+    args : Namespace object
+        Namespace object populated with arguments converted from strings to objects 
+        and assigned as attributes of the namespace object.
+        They store arguments values (str or int, according to the specifications in
+        the code)
+    """
+    parser = get_arguments_parser()
+    parser.add_argument("-j", "--num_workers",
+                        help="Number of repeats run in parallel " + \
+                        "(defaults to the number of CPUs)", type=int)
     return parser.parse_args()
 
 def check_arguments_integrity(args): 
@@ -145,6 +164,13 @@ def get_integrous_arguments_values():
     """
     args = get_arguments_values()
     check_arguments_integrity(args)
+
+    try:
+        assert(args.num_workers is None or args.num_workers > 0)
+    except AssertionError:
+        logging.error("The number of workers must be strictly positive\n")
+        logging.error("Use --help for help.\n")
+        sys.exit(-1)
     return args
 
 def create_dir_if_not_exists(dir_name): 
@@ -244,7 +270,7 @@ def get_analysis_files_names(resu_dir, simu_id):
 
     return analysis_files
 
-def determine_hyperparamaters(args, genotype_fname, phenotype_fnames, network_fname, covariance_fname = None, precision_fname=None):
+def determine_hyperparamaters(args, genotype_fname, phenotypes, network_fname, covariance_fname = None, precision_fname=None):
     """ Determine hyperparameters. 
 
     Parameters
@@ -254,8 +280,8 @@ def determine_hyperparamaters(args, genotype_fname, phenotype_fnames, network_fn
         and contain arguments values (str or int according to code specifications).
     genotype_fname: filename
         Path to genotype data.
-    phenotype_fname: filename
-        Path to phenotype data.
+    phenotypes: (num_tasks, num_samples) array
+        Phenotypes of each task.
     network_fname: filename
         Path to the network file.
     covariance_fname: filename
@@ -280,32 +306,31 @@ def determine_hyperparamaters(args, genotype_fname, phenotype_fnames, network_fn
     # see paper/tech_note
     # Randomly sample 50% of the data
     tmp_scores_f_list = []
-    with tb.open_file(genotype_fname, 'r') as h5f:
-        Xtr = h5f.root.Xtr[:, :]
+    Xtr = generate_data.read_genotypes(genotype_fname)
 
-        # Define subsample of 50% of the data
-        sample_indices = range(args.num_samples)
-        np.random.shuffle(sample_indices)
-        sample_indices = sample_indices[:(args.num_samples/2)]
-        Xtr = Xtr[:, sample_indices]
+    # Define subsample of 50% of the data
+    sample_indices = list(range(args.num_samples))
+    np.random.shuffle(sample_indices)
+    sample_indices = sample_indices[:(args.num_samples//2)]
+    Xtr = Xtr[:, sample_indices]
 
-        # Compute scores for the subsample
-        for task_idx in range(args.num_tasks):
-            # Read phenotype
-            y = np.loadtxt(phenotype_fnames[task_idx])[sample_indices]
+    # Compute scores for the subsample
+    for task_idx in range(args.num_tasks):
+        # Phenotype of the subsample
+        y = phenotypes[task_idx, sample_indices]
 
-            # Compute feature-phenotype correlations
-            r2 = [st.pearsonr(Xtr[feat_idx, :].transpose(), y)[0]**2 \
-                  for feat_idx in range(args.num_features)]
+        # Compute feature-phenotype correlations
+        r2 = [st.pearsonr(Xtr[feat_idx, :].transpose(), y)[0]**2 \
+              for feat_idx in range(args.num_features)]
 
-            # Create temporary file of name tmp_fname 
-            fd, tmp_fname = tempfile.mkstemp()
+        # Create temporary file of name tmp_fname 
+        fd, tmp_fname = tempfile.mkstemp()
 
-            # Save to temporary file
-            np.savetxt(tmp_fname, r2, fmt='%.3e')
+        # Save to temporary file
+        np.savetxt(tmp_fname, r2, fmt='%.3e')
 
-            # Append temporary file to list
-            tmp_scores_f_list.append(tmp_fname)
+        # Append temporary file to list
+        tmp_scores_f_list.append(tmp_fname)
 
     # Compute grid (WARNING: STILL NOT WORKING WELL)
     sfan_ = multitask_sfan.Sfan(args.num_tasks, [network_fname],
@@ -330,7 +355,7 @@ def determine_hyperparamaters(args, genotype_fname, phenotype_fnames, network_fn
     return lbd_eta_values, lbd_eta_mu_values_np, lbd_eta_mu_values
 
 
-def get_tmp_weights_fnames(args, genotype_fname, phenotype_fnames, ssIndices): 
+def get_tmp_weights_fnames(args, genotype_fname, phenotypes, ssIndices): 
     """
     Parameters
     ----------
@@ -339,8 +364,8 @@ def get_tmp_weights_fnames(args, genotype_fname, phenotype_fnames, ssIndices):
         and contain arguments values (str or int according to code specifications).
     genotype_fname: filename
         Path to genotype data.
-    phenotype_fname: filename
-        Path to phenotype data.
+    phenotypes: (num_tasks, num_samples) array
+        Phenotypes of each task.
     ssIndices: list of list of int
         [subsample_idx] = list of subsample indices for the current fold_idx
     
@@ -350,31 +375,31 @@ def get_tmp_weights_fnames(args, genotype_fname, phenotype_fnames, ssIndices):
         [subsample_idx][task_idx] = tmp filename
     """
     tmp_weights_fnames = []
-    for ss_idx in xrange(args.num_subsamples):
+    X = generate_data.read_genotypes(genotype_fname)
+    for ss_idx in range(args.num_subsamples):
         # Get samples
         sample_indices = ssIndices[ss_idx]
         # Generate sample-specific network scores from phenotypes and genotypes
         tmp_weights_f_list = [] # to hold temp files storing these scores
-        with tb.open_file(genotype_fname, 'r') as h5f:
-            Xtr = h5f.root.Xtr[:, sample_indices]
-            for task_idx in xrange(args.num_tasks):
-                # Read phenotype
-                y = np.loadtxt(phenotype_fnames[task_idx])[sample_indices]
-
-                # Compute feature-phenotype correlations
-                r2 = [st.pearsonr(Xtr[feat_idx, :].transpose(), y)[0]**2 \
-                      for feat_idx in xrange(args.num_features)]
-
-                # Save to temporary file tmp_weights_f_list[task_idx]
-                # Create temporary file of name tmp_fname (use tempfile)
-                fd, tmp_fname = tempfile.mkstemp(dir = tmp_dir) #TODO : use arg.tmpdir / change TMP TMPDIR TEMP
-                # /!\ tmp_fname is open, fd is the file object
-                #-> close it to avoid 'Too many open files' error
-                os.close(fd)
-                # Save to temporary file
-                np.savetxt(tmp_fname, r2, fmt='%.3e')
-                # Append temporary file to list
-                tmp_weights_f_list.append(tmp_fname)
+        Xtr = X[:, sample_indices]
+        for task_idx in range(args.num_tasks):
+            # Phenotype of the subsample
+            y = phenotypes[task_idx, sample_indices]
+
+            # Compute feature-phenotype correlations
+            r2 = [st.pearsonr(Xtr[feat_idx, :].transpose(), y)[0]**2 \
+                  for feat_idx in range(args.num_features)]
+
+            # Save to temporary file tmp_weights_f_list[task_idx]
+            # Create temporary file of name tmp_fname (use tempfile)
+            fd, tmp_fname = tempfile.mkstemp(dir = tmp_dir) #TODO : use arg.tmpdir / change TMP TMPDIR TEMP
+            # /!\ tmp_fname is open, fd is the file object
+            #-> close it to avoid 'Too many open files' error
+            os.close(fd)
+            # Save to temporary file
+            np.savetxt(tmp_fname, r2, fmt='%.3e')
+            # Append temporary file to list
+            tmp_weights_f_list.append(tmp_fname)
         tmp_weights_fnames.append(tmp_weights_f_list)
     return tmp_weights_fnames
 
@@ -434,8 +459,9 @@ def run_fold(   fold_idx,
                 indices, 
                 genotype_fname, network_fname , 
                 tmp_weights_fnames, 
-                covariance_fname, causal_fname, phenotype_fnames, scores_fnames, 
-                resu_dir
+                covariance_fname, scores_fnames, 
+                resu_dir,
+                analysis_files=None
             ):
     """ Run the fold n° <fold_idx> of a repeat
 
@@ -473,23 +499,23 @@ def run_fold(   fold_idx,
     covariance_fname : filename
         Path to the covariance matrix file.
 
-    causal_fname : filename
-        Path to the causal weights file.
-
-    phenotype_fnames : filename
-        Path to the phenotype data file.
-
     scores_fnames : filename
         Path to the observed scores file.
     resu_dir : dirname
         Path to the <args.resu_dir>/repeat_<repeat_idx> directory.
+    analysis_files: {dictionary, None}, optional
+        key : <measure>_<algo> 
+        value : filename
+        Files to which the timing and maxRSS of the fold are appended.
+        Defaults to the analysis files of args.resu_dir.
 
     Side effect 
     -----------
     If SEQ_MODE = False, launch qsub job arrays.
 
     """
-    analysis_files = get_analysis_files_names(args.resu_dir, args.simu_id)
+    if analysis_files is None:
+        analysis_files = get_analysis_files_names(args.resu_dir, args.simu_id)
 
     # If real TIME_EXP (no DEBUG_MODE) : 
     #   Do not search for opt_param but take those found before
@@ -550,69 +576,41 @@ def run_fold(   fold_idx,
             # Used to get_tms_weight_f_list
             tmp_weights_f_list = tmp_weights_fnames[ss_idx]
         
-            for params in lbd_eta_values:
-                logging.info("========                        lbd_eta_values : "+ `params`)
-                # Select features with single-task sfan
-                logging.info("                                   run_sfan")
-                sel_, timing, max_RSS = ef.run_sfan(args.num_tasks, network_fname,
-                                   tmp_weights_f_list, params)
-                if not sel_ : import pdb; pdb.set_trace() #DEBUG
-                # Store selected features in the dictionary
-                for task_idx, sel_list in enumerate(sel_):
-                    sf_st_dict[params][task_idx].append(sel_list)
-                #Store process time
-                process_time = timing.split()[-1]
-                fname= process_time_file_template % 'sfan'
-                with open(fname, 'a') as f:
-                    f.write("%s\n" % process_time)
-                #Store max RSS : 
-                fname= max_RSS_file_template % 'sfan'
-                with open(fname, 'a') as f:
-                    f.write("%s\n" % max_RSS)
-            
-            for params in lbd_eta_mu_values_np:
-                logging.info("========                        lbd_eta_mu_values_np"+ `params`)
-                # Select features with multi-task (no precision) sfan
-                logging.info("                                   run_msfan_nocorr")
-                sel_ , timing, max_RSS = ef.run_msfan_nocorr(args.num_tasks, network_fname,
-                                           tmp_weights_f_list, params)
-                if not sel_ : import pdb; pdb.set_trace()#DEBUG
-                # Store selected features in the dictionary
-                for task_idx, sel_list in enumerate(sel_):
-                    sf_np_dict[params][task_idx].append(sel_list)
-                #Store process time
-                process_time = timing.split()[-1]
-                fname= process_time_file_template % 'msfan_np'
-                with open(fname, 'a') as f:
-                    f.write("%s\n" % process_time)
-                #Store max RSS : 
-                fname= max_RSS_file_template %  'msfan_np'
-                with open(fname, 'a') as f:
-                    f.write("%s\n" % max_RSS)
-
-            for params in lbd_eta_mu_values:
-                logging.info("========                        lbd_eta_mu_values"+ `params`)
-                # Select features with multi-task sfan
-                logging.info("                                   run_msfan")
-                sel_, timing, max_RSS = ef.run_msfan(args.num_tasks, network_fname,
-                                    tmp_weights_f_list, covariance_fname,
-                                    params)
-                if not sel_ : import pdb; pdb.set_trace() #DEBUG                                      
+            # Run every (algorithm, parameters) combination concurrently
+            runs = [('sfan', params, sf_st_dict[params],
+                     (ef.run_sfan, (args.num_tasks, network_fname,
+                                    tmp_weights_f_list, params))) \
+                    for params in lbd_eta_values] + \
+                   [('msfan_np', params, sf_np_dict[params],
+                     (ef.run_msfan_nocorr, (args.num_tasks, network_fname,
+                                            tmp_weights_f_list, params))) \
+                    for params in lbd_eta_mu_values_np] + \
+                   [('msfan', params, sf_dict[params],
+                     (ef.run_msfan, (args.num_tasks, network_fname,
+                                     tmp_weights_f_list, covariance_fname,
+                                     params))) \
+                    for params in lbd_eta_mu_values]
+            results = ef.run_sfan_many([job for (algo, params, sf_dict_p, job) in runs])
+
+            for (algo, params, sf_dict_p, job), (sel_, timing, max_RSS) in zip(runs, results):
+                logging.info("========                        %s : %s" % (algo, repr(params)))
+                if len(sel_) != args.num_tasks:
+                    raise RuntimeError("%s returned %d lists of selected features " \
+                                       "for %d tasks (parameters: %s)" % \
+                                       (algo, len(sel_), args.num_tasks, params))
                 # Store selected features in the dictionary
                 for task_idx, sel_list in enumerate(sel_):
-                    sf_dict[params][task_idx].append(sel_list)
+                    sf_dict_p[task_idx].append(sel_list)
                 #Store process time
                 process_time = timing.split()[-1]
-                fname= process_time_file_template % 'msfan'
+                fname= process_time_file_template % algo
                 with open(fname, 'a') as f:
                     f.write("%s\n" % process_time)
                 #Store max RSS : 
-                fname= max_RSS_file_template % 'msfan'
+                fname= max_RSS_file_template % algo
                 with open(fname, 'a') as f:
                     f.write("%s\n" % max_RSS)
 
-
-          
             # Delete the temporary files stored in tmp_weights_f_list
             for fname in tmp_weights_f_list:
                 os.remove(fname)
@@ -624,11 +622,11 @@ def run_fold(   fold_idx,
         # ??? some lists are empty, is it normal ??? 
         logging.info( "======== Get opt params")
         opt_params_st = ef.get_optimal_parameters_from_dict(sf_st_dict, args.num_features)
-        print 'opt param st ', opt_params_st
+        print('opt param st ', opt_params_st)
         opt_params_np = ef.get_optimal_parameters_from_dict(sf_np_dict, args.num_features)
-        print 'opt param np ', opt_params_np
+        print('opt param np ', opt_params_np)
         opt_params = ef.get_optimal_parameters_from_dict(sf_dict, args.num_features)
-        print 'opt params ', opt_params
+        print('opt params ', opt_params)
 
     else : 
         # XXX DEBUG : ??? : 
@@ -659,16 +657,17 @@ def run_fold(   fold_idx,
     # (got a list of list : list of selected features for each task)
     # using the whole training set (i.e. scores_fnames)
     # and optimal parameters.
-    logging.info("          run st")
-    selected_st, timing_st, maxRSS_st = ef.run_sfan(args.num_tasks, network_fname,
-                               scores_fnames, opt_params_st)
-    logging.info("          run np")
-    selected_np, timing_np, maxRSS_np = ef.run_msfan_nocorr(args.num_tasks, network_fname,
-                                       scores_fnames, opt_params_np)
-    logging.info("          run msfan")
-    selected, timing,maxRSS = ef.run_msfan(args.num_tasks, network_fname,
-                                scores_fnames, covariance_fname,
-                                opt_params)
+    logging.info("          run st, np and msfan")
+    ((selected_st, timing_st, maxRSS_st),
+     (selected_np, timing_np, maxRSS_np),
+     (selected, timing, maxRSS)) = ef.run_sfan_many([
+         (ef.run_sfan, (args.num_tasks, network_fname,
+                        scores_fnames, opt_params_st)),
+         (ef.run_msfan_nocorr, (args.num_tasks, network_fname,
+                                scores_fnames, opt_params_np)),
+         (ef.run_msfan, (args.num_tasks, network_fname,
+                         scores_fnames, covariance_fname,
+                         opt_params))])
 
     #------
     # For each algorithm, save timing to file
@@ -698,29 +697,19 @@ def run_fold(   fold_idx,
 
     #------
     # For each algorithm, save selected features to file
+    # (and to its binary copy, <fname>.npy)
     # Single task
     fname = '%s/%s.sfan.fold_%d.selected_features' % \
             (resu_dir, args.simu_id, fold_idx)
-    
-    with open(fname, 'w') as f:
-        for selected_features_list in selected_st:
-            f.write("%s\n" % ' '.join(str(x) for x in selected_features_list))
-                                    # selected_features_list is a list of int 
-                                    # that have to be cast as string so we can join them
+    ef.save_selected_features(fname, selected_st)
     # Multitask (no precision)
     fname = '%s/%s.msfan_np.fold_%d.selected_features' % \
             (resu_dir, args.simu_id, fold_idx)
-    
-    with open(fname, 'w') as f:
-        for selected_features_list in selected_np:
-            f.write("%s\n" % ' '.join(str(x) for x in selected_features_list))
+    ef.save_selected_features(fname, selected_np)
     # Multitask (precision)
     fname = '%s/%s.msfan.fold_%d.selected_features' % \
             (resu_dir, args.simu_id, fold_idx)
-    
-    with open(fname, 'w') as f:
-        for selected_features_list in selected:
-            f.write("%s\n" % ' '.join(str(x) for x in selected_features_list))
+    ef.save_selected_features(fname, selected)
     
     #------
 
@@ -741,6 +730,7 @@ def run_repeat(repeat_idx, args, analysis_files):
     analysis_files: dictionary
         key : <measure>_<algo> 
         value : filename
+        Files to which the timing and maxRSS of the folds are appended.
 
     """
 
@@ -775,14 +765,13 @@ def run_repeat(repeat_idx, args, analysis_files):
     network_fname = '%s/%s.network.dimacs' % (data_dir, args.simu_id)
     covariance_fname = '%s/%s.task_similarities.txt' % (data_dir,
                                                          args.simu_id)
-    causal_fname = '%s/%s.causal_features.txt' % (data_dir, args.simu_id)
-    phenotype_fnames = ['%s/%s.phenotype_%d.txt' % \
-                        (data_dir, args.simu_id, task_idx) \
-                        for task_idx in range(args.num_tasks)]
     scores_fnames = ['%s/%s.scores_%d.txt' % \
                      (data_dir, args.simu_id, task_idx) \
                      for task_idx in range(args.num_tasks)]
 
+    # Phenotypes, as a (num_tasks, num_samples) array
+    phenotypes = generate_data.read_causal_features_and_phenotypes(data_dir, args.simu_id,
+                                                                   args.num_tasks)[1]
     
     #-------------------------------------------------------------------------
 
@@ -808,7 +797,7 @@ def run_repeat(repeat_idx, args, analysis_files):
     lbd_eta_values, lbd_eta_mu_values_np, lbd_eta_mu_values  = determine_hyperparamaters(
                                                                     args, 
                                                                     genotype_fname, 
-                                                                    phenotype_fnames,
+                                                                    phenotypes,
                                                                     network_fname,
                                                                     covariance_fname = covariance_fname, 
                                                                     precision_fname = None
@@ -832,20 +821,20 @@ def run_repeat(repeat_idx, args, analysis_files):
     # use these opt param to select feature using the all training set. = predict causal status of features <- quantify these perf
     # use a ridge regression trained with selected features only to predict quantitativ phenotypes on test set <- quantify these perf
     if SEQ_MODE : 
-        for fold_idx in xrange(args.num_folds):
+        for fold_idx in range(args.num_folds):
             logging.info ("============= FOLD : %d"%fold_idx)
-            tmp_weights_fnames = get_tmp_weights_fnames(args, genotype_fname, phenotype_fnames, evalf.xp_indices[fold_idx]['ssIndices'])
+            tmp_weights_fnames = get_tmp_weights_fnames(args, genotype_fname, phenotypes, evalf.xp_indices[fold_idx]['ssIndices'])
             run_fold(
                 fold_idx,
                 args, 
                 lbd_eta_values, lbd_eta_mu_values_np, lbd_eta_mu_values, 
                 evalf.xp_indices[fold_idx], 
-                genotype_fname, network_fname ,tmp_weights_fnames,  covariance_fname , causal_fname, phenotype_fnames, scores_fnames,
-                resu_dir)
+                genotype_fname, network_fname ,tmp_weights_fnames,  covariance_fname, scores_fnames,
+                resu_dir, analysis_files=analysis_files)
 
     else :
-        for fold_idx in xrange(args.num_folds):
-            tmp_weights_fnames = get_tmp_weights_fnames(args, genotype_fname, phenotype_fnames, evalf.xp_indices[fold_idx]['ssIndices'])
+        for fold_idx in range(args.num_folds):
+            tmp_weights_fnames = get_tmp_weights_fnames(args, genotype_fname, phenotypes, evalf.xp_indices[fold_idx]['ssIndices'])
             save_tmp_weights_fnames(resu_dir, args.simu_id, fold_idx, tmp_weights_fnames)
         if  TIME_EXP :
             cmd = "qsub -l hostname='compute-0-%d' -cwd -V -N snp%dr%df -t 1-%d -e %/dev/null -o /dev/null\
@@ -864,13 +853,114 @@ def run_repeat(repeat_idx, args, analysis_files):
                   args.num_tasks, args.num_features, args.num_samples, args.num_repeats, args.num_folds, args.num_subsamples,
                   args.data_dir, args.resu_dir, args.simu_id, hyperparam_fname_np, hyperparam_fname, repeat_idx)
 
-        print cmd
+        print(cmd)
         p = subprocess.Popen(shlex.split(cmd))
 
     # run predictions -> in main
     # print analysis_files -> in main
 
 
+class RepeatProcess(multiprocessing.Process):
+    """ Worker process of RepeatsPool.
+
+    It stays non-daemonic, so that the repeat it runs can start
+    the worker processes of its solvers (see ef.run_sfan_many).
+    """
+    @property
+    def daemon(self):
+        return False
+
+    @daemon.setter
+    def daemon(self, value):
+        pass
+
+
+class RepeatsPool(multiprocessing.pool.Pool):
+    """ Pool of (non-daemonic) processes running repeats.
+    """
+    @staticmethod
+    def Process(*args, **kwargs):
+        # Python 3 passes the multiprocessing context first
+        return RepeatProcess(**kwargs)
+
+
+def run_repeat_process(repeat_idx, args):
+    """ Run the repeat n° <repeat_idx>, in a worker process of RepeatsPool.
+
+    Parameters
+    ----------
+    repeat_idx : int 
+        Index of the current repeat. 
+    args : Namespace object
+        Its attributes are arguments names 
+        and contain arguments values (str or int according to code specifications).
+
+    Returns
+    -------
+    repeat_measures : dictionary
+        key : timing_<algo> or maxRSS_<algo>
+        value : list of the lines written by the repeat to this analysis file
+
+    Side effect
+    -----------
+    Reseed the global random number generators, which would otherwise
+    be in the same state in all the forked processes.
+    The timing and maxRSS of the repeat are written to the analysis files
+    of <args.resu_dir>/repeat_<repeat_idx>, which are then removed.
+    """
+    np.random.seed()
+    random.seed()
+
+    repeat_analysis_files = get_analysis_files_names('%s/repeat_%d' % \
+                                                     (args.resu_dir, repeat_idx),
+                                                     args.simu_id)
+    run_repeat(repeat_idx, args, repeat_analysis_files)
+
+    repeat_measures = {}
+    for key, fname in repeat_analysis_files.items():
+        if key.startswith(('timing_', 'maxRSS_')) and os.path.isfile(fname):
+            with open(fname, 'r') as f:
+                repeat_measures[key] = f.readlines()
+            os.remove(fname)
+    return repeat_measures
+
+
+def run_repeats_parallel(args, analysis_files, num_workers):
+    """ Run the repeats in parallel, each one in its own process.
+
+    Parameters
+    ----------
+    args : Namespace object
+        Its attributes are arguments names 
+        and contain arguments values (str or int according to code specifications).
+    analysis_files: dictionary
+        key : <measure>_<algo> 
+        value : filename
+    num_workers : int
+        Maximum number of repeats run at the same time.
+
+    Side effect
+    -----------
+    The timing and maxRSS of the repeats are appended, in the order of
+    the repeats, to analysis_files, once they are all done.
+    """
+    pool = RepeatsPool(num_workers, maxtasksperchild=1)
+    try:
+        repeats_measures = pool.map(functools.partial(run_repeat_process, args=args),
+                                    range(args.num_repeats), chunksize=1)
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    # Append the timing and maxRSS of each repeat, in order
+    for repeat_measures in repeats_measures:
+        for key in sorted(repeat_measures):
+            with open(analysis_files[key], 'a') as f:
+                f.writelines(repeat_measures[key])
+
 
 def main():
     """ Run validation experiments on synthetic data .
@@ -889,6 +979,9 @@ def main():
         Number of cross-validation folds.
     args.num_subsamples: int
         Number of subsamples (for stability evaluation).
+    args.num_workers: {int, None}
+        Number of repeats run in parallel, in worker processes.
+        Defaults to the number of CPUs.
     args.data_dir: filename
         Path of the directory in which to save the simulated data.
     args.resu_dir: filename
@@ -906,19 +999,15 @@ def main():
             README file describing the simulation paramters
         <simu_id>.task_similarities.txt:
             Matrix of covariance between tasks
-        <simu_id>.causal_features:
-            Lists of causal features.
-            One list per task. Indices start at 0.
-        <simu_id>.causal_weights:
-            Lists of the weights given to the causal features.
-            One list per task. Same order as in <data_dir>/<simu_id>.causal_features.
+        <simu_id>.bundle.npz:
+            Task precision matrix, causal weights, causal features,
+            phenotypes and node weights
+            (see generate_data.SyntheticDataGenerator.generate_modular).
         <simu_id>.genotypes.txt:
             num_features x num_samples matrix of {0, 1, 2} (representing SNPs).
         <simu_id>.network.dimacs:
             Network over the features.
         For task_id in 0, ..., args.num_tasks:
-            <simu_id>.phenotype_<task_id>.txt:
-                Phenotype vector (of size args.num_samples) for task <task_id>.
             <simu_id>.scores_<task_id>.txt
                 Node weights (of size args.num_features) for task <task_id>.
                 Computed as Pearson correlation.
@@ -926,16 +1015,11 @@ def main():
     2. Results
     For each repeat, under <args.resu_dir>/repeat_<repeat_idx>:
 
+        <simu_id>.indices.npz
+            Training, test and subsample indices of all folds
+            (see evaluation_framework.save_indices_archive).
+
         For each fold_idx:
-            <simu_id>.<fold_idx>.trIndices
-                Space-separated list of training indices.
-            <simu_id>.<fold_idx>.teIndices
-                Space-separated list of test indices.
-            For each subsample_idx:
-                <data_dir>/<simu_id>.<fold_idx>.<ss_idx>.ssIndices
-                    Space-separated lists of subsample indices,
-                    one line per list / subsample.
-        
             For each algo in ('sfan', 'msfan_np', 'msfan'):
                 <simu_id>.<algo>.fold_<fold_idx>.parameters
                      Optimal parameters.
@@ -945,6 +1029,9 @@ def main():
                     Each line corresponds to a task and contains a 
                     space-separated list of indices, STARTING AT 0.
 
+                <simu_id>.<algo>.fold_<fold_idx>.selected_features.npy
+                    Same, as an int32 array (one row per task, padded with -1).
+
                 <simu_id>.<algo>.fold_<fold_idx>.task_<task_idx>.predicted
                     Predictions, on the test set, of a ridge regression
                     trained only on the selected features.
@@ -1005,7 +1092,20 @@ def main():
 
 
     #-------------------------------------------------------------------------
-    for repeat_idx in xrange(args.num_repeats):
+    # The repeats are independent (each one has its own data and results
+    # directories, only timing and maxRSS are appended to shared files):
+    # run them in parallel
+    num_workers = args.num_workers
+    if num_workers is None:
+        num_workers = multiprocessing.cpu_count()
+    num_workers = min(num_workers, args.num_repeats)
+
+    if num_workers > 1:
+        # Share the CPUs between the solvers of the repeats
+        ef.max_num_workers = max(1, multiprocessing.cpu_count() // num_workers)
+        run_repeats_parallel(args, analysis_files, num_workers)
+    else:
+        for repeat_idx in range(args.num_repeats):
             run_repeat(repeat_idx, args, analysis_files)
 
 
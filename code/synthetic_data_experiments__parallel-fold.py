@@ -1,4 +1,5 @@
 import synthetic_data_experiments as sde
+import evaluation_framework as ef
 import argparse
 import logging
 
@@ -51,10 +52,6 @@ if __name__ == "__main__":
     network_fname = '%s/%s.network.dimacs' % (data_dir, args.simu_id)
     precision_fname = '%s/%s.task_similarities.txt' % (data_dir,
                                                          args.simu_id)
-    causal_fname = '%s/%s.causal_features.txt' % (data_dir, args.simu_id)
-    phenotype_fnames = ['%s/%s.phenotype_%d.txt' % \
-                        (data_dir, args.simu_id, task_idx) \
-                        for task_idx in range(args.num_tasks)]
     scores_fnames = ['%s/%s.scores_%d.txt' % \
                      (data_dir, args.simu_id, task_idx) \
                      for task_idx in range(args.num_tasks)]
@@ -78,22 +75,8 @@ if __name__ == "__main__":
             lbd_eta_mu_values.append(line)
     
     # indices for this fold : 
-    # TODO : factorisation of fname template...
-    trIndices_fname = resu_dir+'/'+args.simu_id+'.fold%d.trIndices'
-    teIndices_fname = resu_dir+'/'+args.simu_id+'.fold%d.teIndices'
-    ssIndices_fname = resu_dir+'/'+args.simu_id+'.fold%d.ss%d.ssIndices'
-
-    indices = {'trIndices': list(), 'teIndices':list(), 'ssIndices':list()}
-    with open(trIndices_fname %(args.fold_idx), 'r') as trIndices_f : 
-        line = trIndices_f.readline().split()
-        indices["trIndices"] = [int (i) for i in line ]
-    with open(teIndices_fname %(args.fold_idx),'r') as teIndices_f : 
-        line = teIndices_f.readline().split()
-        indices["teIndices"] =  [int (i) for i in line ]
-    for ss_idx in xrange(args.num_subsamples) :
-        with open(ssIndices_fname  %(args.fold_idx,ss_idx), 'r') as ssIndices_f:
-            line = ssIndices_f.readline().split()
-            indices["ssIndices"].append(  [int (i) for i in line ] )        
+    indices = ef.read_indices(resu_dir, args.simu_id, args.num_folds,
+                              args.num_subsamples)[args.fold_idx]
                       
     tmp_weights_fnames = sde.fetch_tmp_weights_fnames(resu_dir, args.simu_id, args.fold_idx)
              
@@ -102,6 +85,6 @@ if __name__ == "__main__":
             args, 
             lbd_eta_values, lbd_eta_mu_values_np, lbd_eta_mu_values,
             indices, 
-            genotype_fname, network_fname , tmp_weights_fnames, precision_fname , causal_fname, phenotype_fnames, scores_fnames,
+            genotype_fname, network_fname , tmp_weights_fnames, precision_fname , scores_fnames,
             resu_dir)
     